@@ -1,34 +1,128 @@
 #!/usr/bin/python3
 
 import re
+import os
+import gzip
+import hashlib
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 from mq_utils import runner_utils as ru
 
+try:
+    import pyarrow  # noqa: F401 (parquet engine)
+    CACHE_FORMAT = "parquet"
+except ImportError:
+    CACHE_FORMAT = "pkl"
 
-def grep_header_info(fasta: str) -> pd.DataFrame:
+COLUMNS = ['uniprot', 'description', 'symbol', 'organism', 'ox', 'pe', 'sv']
+GENE_NAME = re.compile(r"GN=(.*)\sPE")
+HEADER = re.compile(r"\|(.*)\|\S*\s(.*)\sOS=(.*)\sOX=(.*)\sPE=(.*)\sSV=(.*)")
+HEADER_WITH_GENE = re.compile(r"\|(.*)\|\S*\s(.*)\sOS=(.*)\sOX=(.*)\sGN=.*\sPE=(.*)\sSV=(.*)")
+
+
+def grep_header_info(fasta: str, n_jobs: int = 1, cache_dir: str = None) -> pd.DataFrame:
     """
     Grep information from headers in given fasta file.
 
-    :param fasta: Fasta file
+    :param fasta: Fasta file, optionally gzipped
+    :param n_jobs: Number of processes parsing parts of the file in parallel (not for gzipped files)
+    :param cache_dir: Directory to save the grepped information in, keyed by the hash of the file. If None, the file
+                      is parsed on every call.
     :return: Grepped information as dataframe with columns := 'uniprot','description','symbol','organism','ox','pe','sv'
     """
-    infos = list()
-    with open(fasta) as file:
-        for line in file:
-            if line.startswith('>'):
-                # get gene name
-                matches = re.search("GN=(.*)\sPE", line)
-                gene_name = matches.group(1) if matches else ""
-                gene_string = "GN=.*\s" if matches else ""
-                # get full info
-                matches = re.search("\|(.*)\|\S*\s(.*)\sOS=(.*)\sOX=(.*)\s" + gene_string + "PE=(.*)\sSV=(.*)", line)
-                infos.append([matches.group(1), matches.group(2), gene_name, matches.group(3),
-                              matches.group(4), matches.group(5), matches.group(6)])
-    return pd.DataFrame(infos, columns=['uniprot', 'description', 'symbol', 'organism', 'ox', 'pe', 'sv'])
+    # ==== Load previously grepped information ====
+    if cache_dir is not None:
+        cache_file = os.path.join(cache_dir, f"fasta_{get_file_hash(fasta)}.{CACHE_FORMAT}")
+        if os.path.exists(cache_file):
+            return pd.read_parquet(cache_file) if CACHE_FORMAT == "parquet" else pd.read_pickle(cache_file)
+    # ==== Parse gzipped or small files in one stream ====
+    if fasta.endswith(".gz") or n_jobs <= 1:
+        with (gzip.open(fasta, "rb") if fasta.endswith(".gz") else open(fasta, "rb")) as file:
+            infos = pd.DataFrame.from_records(parse_headers(file), columns=COLUMNS)
+    # ==== Parse byte ranges of the file in parallel ====
+    else:
+        size = os.path.getsize(fasta)
+        bounds = [size * i // n_jobs for i in range(n_jobs + 1)]
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            parts = list(executor.map(grep_range, [fasta] * n_jobs, bounds[:-1], bounds[1:]))
+        infos = pd.DataFrame.from_records([x for part in parts for x in part], columns=COLUMNS)
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        if CACHE_FORMAT == "parquet":
+            infos.to_parquet(cache_file)
+        else:
+            infos.to_pickle(cache_file)
+    return infos
+
+
+def parse_headers(lines):
+    """
+    Parse all header lines of a fasta file stream.
+
+    :param lines: Iterable of fasta lines as bytes
+    :return: Generator of lists with grepped information per header
+    """
+    for line in lines:
+        if line.startswith(b'>'):
+            yield parse_header(line.decode().rstrip("\r\n"))
+
+
+def parse_header(line: str) -> list:
+    """
+    Grep information from one fasta header.
+
+    :param line: Header line
+    :return: List with 'uniprot','description','symbol','organism','ox','pe','sv'
+    """
+    # get gene name
+    matches = GENE_NAME.search(line)
+    gene_name = matches.group(1) if matches else ""
+    # get full info
+    matches = (HEADER_WITH_GENE if matches else HEADER).search(line)
+    return [matches.group(1), matches.group(2), gene_name, matches.group(3),
+            matches.group(4), matches.group(5), matches.group(6)]
+
+
+def grep_range(fasta: str, start: int, end: int) -> list:
+    """
+    Grep information from all headers starting in the byte range [start, end) of the fasta file.
+
+    :param fasta: Fasta file
+    :param start: First byte of the range
+    :param end: First byte after the range
+    :return: List of grepped information per header
+    """
+    with open(fasta, "rb") as file:
+        # ==== Skip partial line, it belongs to the previous range ====
+        if start > 0:
+            file.seek(start - 1)
+            file.readline()
+        infos = list()
+        while file.tell() < end:
+            line = file.readline()
+            if not line:
+                break
+            if line.startswith(b'>'):
+                infos.append(parse_header(line.decode().rstrip("\r\n")))
+        return infos
+
+
+def get_file_hash(file: str) -> str:
+    """
+    Get hash of the file content.
+
+    :param file: Path of the file
+    :return: Hex digest of the file content
+    """
+    file_hash = hashlib.blake2b(digest_size=16)
+    with open(file, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
 
 
 if __name__ == "__main__":
     description = "                  Grep protein info from fasta file."
-    parameters = ru.save_parameters(script_desc=description, arguments=('f_req', 'o'))
-    df = grep_header_info(fasta=parameters.fasta_file)
+    parameters = ru.save_parameters(script_desc=description, arguments=('f_req', 'nj', 'o'))
+    df = grep_header_info(fasta=parameters.fasta_file, n_jobs=parameters.n_jobs)
     df.to_csv(parameters.out_dir + "grepped_info.csv", header=True, index=False)
@@ -1,15 +1,19 @@
 #!/usr/bin/python3
 
-import csv
 import pandas as pd
 from mq_utils import mapping_handler as mh, runner_utils as ru
-from mq_utils.logger import get_filter_ids_logging
+from mq_utils.cell_cache import map_cells
+from mq_utils.logger import get_filter_ids_logging, get_filter_ids_overview
+from mq_utils.parallel_utils import map_partitions
+from mq_utils.table_utils import split_ids, join_ids
 from pathlib import Path
 
 
 def filter_protein_ids(data: pd.DataFrame, protein_column: str, organism: str = None,
                        rev_con: bool = False, keep_empty: bool = True,
-                       reviewed: bool = True, res_column: str = None):
+                       reviewed: bool = True, res_column: str = None,
+                       mapping_dir: str = None, expiry_days: float = None,
+                       uniprot_file: str = None, handler: mh.MappingHandler = None, n_jobs: int = 1):
     """
     Filter protein ids in given data by chosen organism.
 
@@ -20,25 +24,38 @@ def filter_protein_ids(data: pd.DataFrame, protein_column: str, organism: str =
     :param keep_empty: Set True if empty rows should be kept
     :param reviewed: Set True if only reviewed protein IDs should be kept
     :param res_column: Set column name for remap genenames results. If None, the gene_column will be overridden.
+    :param mapping_dir: Directory to persist fetched mappings in. If None, mappings are not persisted.
+    :param expiry_days: Days after which persisted mappings are fetched again. If None, they never expire.
+    :param uniprot_file: Local UniProt FASTA or TSV export to use instead of the UniProt API
+    :param handler: Handler with prefetched mappings to reuse, e.g. across chunks of one table. If None, a new
+                    handler is created from the options above.
+    :param n_jobs: Number of processes to transform the rows in after the mappings were fetched
     :return: Filtered data as dataframe
     """
     data_copy = data.copy(deep=True)
     data_copy = data_copy.fillna("")
     data_copy[protein_column] = data_copy[protein_column].astype("string")
 
-    handler = mh.MappingHandler()
+    if handler is None:
+        handler = mh.MappingHandler(mapping_dir=mapping_dir, expiry_days=expiry_days, uniprot_file=uniprot_file)
     # ==== Get all existing mappings in one batch ====
     handler.get_mapping(ids=";".join(data_copy[protein_column]).split(";"),
                         in_type="protein", organism=organism)
 
-    # ==== Filter row wise ====
-    filtered_ids = data_copy[protein_column].apply(
-        lambda x: get_filtered_ids(ids=x.split(";"), handler=handler, organism=organism, rev_con=rev_con,
-                                   reviewed=reviewed))
+    # ==== Filter all rows at once, or parts of the rows in n_jobs processes ====
+    if n_jobs > 1:
+        parts = map_partitions(filter_partition, data=data_copy[[protein_column]], n_jobs=n_jobs,
+                               shared={"handler": handler}, protein_column=protein_column, organism=organism,
+                               rev_con=rev_con, reviewed=reviewed)
+        filtered_ids = pd.concat([x[0] for x in parts])
+        overview = pd.concat([x[1] for x in parts])
+    else:
+        filtered_ids, overview = filter_partition(data_copy, handler=handler, protein_column=protein_column,
+                                                  organism=organism, rev_con=rev_con, reviewed=reviewed)
 
     # ==== Logging ====
     log_dict = get_filter_ids_logging(original=data_copy[protein_column], filtered=filtered_ids, handler=handler,
-                                      organism=organism)
+                                      organism=organism, overview=overview)
 
     # ==== If target column depending if res_column is set ====
     column = res_column if res_column is not None else protein_column
@@ -46,9 +63,6 @@ def filter_protein_ids(data: pd.DataFrame, protein_column: str, organism: str =
     # ==== Set filtered ids to dataframe ====
     data_copy[column] = filtered_ids
 
-    # ==== Save current mapping to files
-    # handler.save_mappings(mapping_dir="mappings/")
-
     # ==== Remove rows with empty protein IDs ====
     if keep_empty is False:
         data_copy = data_copy[data_copy[column] != ""]  # remove
@@ -56,6 +70,24 @@ def filter_protein_ids(data: pd.DataFrame, protein_column: str, organism: str =
     return data_copy, log_dict
 
 
+def filter_partition(data: pd.DataFrame, handler: mh.MappingHandler, protein_column: str, organism: str = None,
+                     rev_con: bool = False, reviewed: bool = False):
+    """
+    Filter protein IDs and build the overview log of (a part of) the rows.
+
+    :param data: Dataframe containing a column with protein IDs
+    :param handler: MappingHandler object with prefetched mappings
+    :param protein_column: Column name with protein IDs
+    :param organism: Organism the IDs should belong to
+    :param rev_con: Bool to indicate if decoy and contaminant IDs should be kept
+    :param reviewed: Bool to indicate if only reviewed IDs should be kept
+    :return: Series with filtered IDs and overview log
+    """
+    filtered_ids = get_filtered_ids_bulk(ids=data[protein_column], handler=handler, organism=organism,
+                                         rev_con=rev_con, reviewed=reviewed)
+    return filtered_ids, get_filter_ids_overview(original=data[protein_column], filtered=filtered_ids)
+
+
 def get_filtered_ids(ids, handler: mh.MappingHandler, organism: str = None, rev_con: bool = False,
                      reviewed: bool = False) -> str:
     """
@@ -85,20 +117,72 @@ def get_filtered_ids(ids, handler: mh.MappingHandler, organism: str = None, rev_
     return ';'.join(prot_ids)
 
 
+def get_filtered_ids_bulk(ids: pd.Series, handler: mh.MappingHandler, organism: str = None, rev_con: bool = False,
+                          reviewed: bool = False) -> pd.Series:
+    """
+    Filter protein ids of all rows in one pass. Gives the same result as applying get_filtered_ids on each row.
+    Each distinct cell is filtered once, cells filtered in earlier calls on the same handler are taken from its
+    cell cache.
+
+    :param ids: Series with semicolon separated protein IDs per row
+    :param handler: MappingHandler object
+    :param organism: Organism the IDs should belong to
+    :param rev_con: Bool to indicate if decoy and contaminant IDs should be kept
+    :param reviewed: Bool to indicate if only reviewed IDs should be kept
+    :return: Series with filtered IDs combined into a string per row
+    """
+    return map_cells(ids, transform=lambda cells: get_filtered_ids_cells(ids=cells, handler=handler,
+                                                                         organism=organism, rev_con=rev_con,
+                                                                         reviewed=reviewed),
+                     cache=handler.cell_cache, key=("protein", "filter", organism, rev_con, reviewed))
+
+
+def get_filtered_ids_cells(ids: pd.Series, handler: mh.MappingHandler, organism: str = None, rev_con: bool = False,
+                           reviewed: bool = False) -> pd.Series:
+    """
+    Filter protein ids of the given cells in one vectorized pass.
+
+    :param ids: Series with semicolon separated protein IDs per cell
+    :param handler: MappingHandler object
+    :param organism: Organism the IDs should belong to
+    :param rev_con: Bool to indicate if decoy and contaminant IDs should be kept
+    :param reviewed: Bool to indicate if only reviewed IDs should be kept
+    :return: Series with filtered IDs combined into a string per cell
+    """
+    split = split_ids(ids, name="Protein ID")
+    # ==== Get mapping on protein IDs ====
+    mapping, _ = handler.get_preloaded(in_list=split["Protein ID"].cat.categories, in_type="protein",
+                                       organism=organism)
+    mapped = split["Protein ID"].isin(mapping["Protein ID"])
+    # ==== Rows without any mapped ID stay empty ====
+    has_mapping = mapped.groupby(split["row"]).transform("any")
+
+    # ==== Keep only reviewed IDs based on flag ====
+    if reviewed:
+        mapped = split["Protein ID"].isin(mapping.loc[mapping['Reviewed'] == "reviewed", "Protein ID"])
+
+    # ==== Keep or remove decoy/contaminants IDs based on flag ====
+    keep = split["Protein ID"].str.startswith(("REV", "CON")) if rev_con else False
+
+    # ==== Combine mapped IDs with kept or left decoy IDs ====
+    return join_ids(split[has_mapping & (mapped | keep)], column=ids, name="Protein ID")
+
+
 if __name__ == "__main__":
     description = "        Filter proteins by organism and/or decoy/contaminants names in data file."
     parameters = ru.save_parameters(script_desc=description,
-                                    arguments=('d', 'pc_req', 'or', 'rv', 'ke', 'r', 'rc', 'o'))
-    df, log = filter_protein_ids(data=parameters.data, protein_column=parameters.protein_column,
-                                 organism=parameters.organism, rev_con=parameters.rev_con,
-                                 keep_empty=parameters.keep_empty, reviewed=parameters.reviewed,
-                                 res_column=parameters.res_column)
-    df.to_csv(parameters.out_dir + Path(parameters.file_name).stem + "_filtered.txt", header=True, index=False,
-              quoting=csv.QUOTE_NONNUMERIC, sep=" ")
-
-    log["Overview_Log"].to_csv(
-        parameters.out_dir + Path(parameters.file_name).stem + "_filtered_overview_log.txt",
-        header=True, index=False, quoting=csv.QUOTE_NONNUMERIC, sep=" ")
-    log["Detailed_Log"].to_csv(
-        parameters.out_dir + Path(parameters.file_name).stem + "_filtered_detailed_log.txt",
-        header=True, index=False, quoting=csv.QUOTE_NONNUMERIC, sep=" ")
+                                    arguments=('d', 'pc_req', 'or', 'rv', 'ke', 'r', 'rc', 'md', 'uf', 'cs', 'nj', 'o'))
+    # ==== One handler for all chunks in streaming mode ====
+    handler = mh.MappingHandler(mapping_dir=parameters.mapping_dir, expiry_days=parameters.expiry_days,
+                                uniprot_file=parameters.uniprot_file)
+    out_file = parameters.out_dir + Path(parameters.file_name).stem
+    ru.write_results(data=parameters.data,
+                     process=lambda data: filter_protein_ids(data=data, protein_column=parameters.protein_column,
+                                                             organism=parameters.organism, rev_con=parameters.rev_con,
+                                                             keep_empty=parameters.keep_empty,
+                                                             reviewed=parameters.reviewed,
+                                                             res_column=parameters.res_column, handler=handler,
+                                                             n_jobs=parameters.n_jobs),
+                     files={"Data": out_file + "_filtered.txt",
+                            "Overview_Log": out_file + "_filtered_overview_log.txt",
+                            "Detailed_Log": out_file + "_filtered_detailed_log.txt"})
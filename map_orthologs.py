@@ -1,52 +1,116 @@
 #!/usr/bin/python3
 
-import csv
 from pathlib import Path
 import pandas as pd
 from mq_utils import mapping_handler as mh, runner_utils as ru
-from mq_utils.logger import get_ortholog_genenames_logging
+from mq_utils.cell_cache import map_cells
+from mq_utils.logger import get_ortholog_genenames_logging, get_ortholog_genenames_overview, get_ortholog_removed
+from mq_utils.parallel_utils import map_partitions
+from mq_utils.table_utils import split_ids, join_ids
 
 
-def map_orthologs(data: pd.DataFrame, gene_column: str, organism: str, tar_organism: str,
-                  keep_empty: bool = True, res_column: str = None):
+def map_orthologs(data: pd.DataFrame, gene_column: str, organism: str, tar_organism,
+                  keep_empty: bool = True, res_column: str = None,
+                  mapping_dir: str = None, expiry_days: float = None,
+                  ortholog_file: str = None, ortholog_fallback: bool = False, handler: mh.MappingHandler = None,
+                  n_jobs: int = 1):
     """
     Map gene names of origin organism to orthologs of target organism.
 
     :param data: Dataframe containing a column with gene names
     :param gene_column: Column name with gene names
     :param organism: Organism of the input ids
-    :param tar_organism: Organism to map to
-    :param keep_empty: Set True if empty rows should be kept
+    :param tar_organism: Organism to map to, or list of organisms to map to in one pass
+    :param keep_empty: Set True if empty rows should be kept. With several target organisms, only rows without
+                       orthologs in any target organism are removed.
     :param res_column: Set column name for ortholog results. If None, the gene_column will be overridden.
-    :return: Data as dataframe with ortholog ids
+                       With several target organisms, one column named <res_column>_<tar_organism> is added per
+                       target organism, using gene_column if res_column is None.
+    :param mapping_dir: Directory to persist fetched mappings in. If None, mappings are not persisted.
+    :param expiry_days: Days after which persisted mappings are fetched again. If None, they never expire.
+    :param ortholog_file: Local ortholog table (TSV) to use instead of gProfiler
+    :param ortholog_fallback: Set True to request gene names missing in the local ortholog table from gProfiler
+    :param handler: Handler with prefetched mappings to reuse, e.g. across chunks of one table. If None, a new
+                    handler is created from the options above.
+    :param n_jobs: Number of processes to transform the rows in after the mappings were fetched
+    :return: Data as dataframe with ortholog ids and logging dictionary, one logging dictionary per target
+             organism if a list of target organisms was given
     """
     data_copy = data.copy(deep=True)
     data_copy = data_copy.fillna("")
     data_copy[gene_column] = data_copy[gene_column].astype("string")
-
-    handler = mh.MappingHandler()
-    # ==== Get all existing mappings in one batch ====
-    handler.get_mapping(ids=";".join(data_copy[gene_column]).split(";"),
-                        in_type="orthologs", organism=organism, tar_organism=tar_organism)
-
-    ortholog_gene_names = data_copy[gene_column].apply(
-        lambda x: get_orthologs(ids=x.split(";"), handler=handler, organism=organism, tar_organism=tar_organism))
-
-    # ==== Logging ====
-    log_dict = get_ortholog_genenames_logging(original=data_copy[gene_column], orthologs=ortholog_gene_names,
-                                              handler=handler, organism=organism, tar_organism=tar_organism)
+    tar_organisms = [tar_organism] if isinstance(tar_organism, str) else list(dict.fromkeys(tar_organism))
+
+    if handler is None:
+        handler = mh.MappingHandler(mapping_dir=mapping_dir, expiry_days=expiry_days, ortholog_file=ortholog_file,
+                                    ortholog_fallback=ortholog_fallback)
+    # ==== Split gene names once for all target organisms ====
+    split = split_ids(data_copy[gene_column], name="source_symbol")
+    # ==== Get all existing mappings in one batch, target organisms are requested concurrently ====
+    handler.get_ortholog_mappings(ids=split["source_symbol"].cat.categories, organism=organism,
+                                  tar_organisms=tar_organisms)
+    # ==== Gene names without ortholog in any row, needed for the overview logs ====
+    removed = {tar: set(get_ortholog_removed(original=data_copy[gene_column], handler=handler, organism=organism,
+                                             tar_organism=tar)[0]["source_symbol"]) for tar in tar_organisms}
+
+    # ==== Map all rows at once, or parts of the rows in n_jobs processes ====
+    if n_jobs > 1:
+        parts = map_partitions(orthologs_partition, data=data_copy[[gene_column]], n_jobs=n_jobs,
+                               shared={"handler": handler, "removed": removed}, gene_column=gene_column,
+                               organism=organism, tar_organisms=tar_organisms)
+        results = {tar: (pd.concat([x[tar][0] for x in parts]), pd.concat([x[tar][1] for x in parts]))
+                   for tar in tar_organisms}
+    else:
+        results = orthologs_partition(data_copy, handler=handler, removed=removed, gene_column=gene_column,
+                                      organism=organism, tar_organisms=tar_organisms)
+
+    ortholog_gene_names = dict()
+    log_dicts = dict()
+    for tar in tar_organisms:
+        ortholog_gene_names[tar], overview = results[tar]
+        # ==== Logging ====
+        log_dicts[tar] = get_ortholog_genenames_logging(original=data_copy[gene_column],
+                                                        orthologs=ortholog_gene_names[tar], handler=handler,
+                                                        organism=organism, tar_organism=tar, overview=overview)
 
     # ==== If target column depending if res_column is set ====
     column = res_column if res_column is not None else gene_column
+    columns = {tar: column for tar in tar_organisms} if isinstance(tar_organism, str) else \
+        {tar: f"{column}_{tar}" for tar in tar_organisms}
 
     # ==== Set ortholog gene names to dataframe ====
-    data_copy[column] = ortholog_gene_names
+    for tar in tar_organisms:
+        data_copy[columns[tar]] = ortholog_gene_names[tar]
 
     # ==== Remove rows with empty ortholog gene names ====
     if keep_empty is False:
-        data_copy = data_copy[data_copy[column] != ""]  # remove
+        data_copy = data_copy[(data_copy[list(columns.values())] != "").any(axis=1)]  # remove
+
+    if isinstance(tar_organism, str):
+        return data_copy, log_dicts[tar_organism]
+    return data_copy, log_dicts
 
-    return data_copy, log_dict
+
+def orthologs_partition(data: pd.DataFrame, handler, removed: dict, gene_column: str, organism: str,
+                        tar_organisms: list) -> dict:
+    """
+    Map orthologs and build the overview logs of (a part of) the rows for each target organism.
+
+    :param data: Dataframe containing a column with gene names
+    :param handler: Handler with prefetched mappings
+    :param removed: Gene names without ortholog per target organism
+    :param gene_column: Column name with gene names
+    :param organism: Organism of the input ids
+    :param tar_organisms: Organisms to map to
+    :return: Dictionary with series of ortholog gene names and overview log per target organism
+    """
+    results = dict()
+    for tar in tar_organisms:
+        orthologs = get_orthologs_bulk(ids=data[gene_column], handler=handler, organism=organism,
+                                       tar_organism=tar)
+        results[tar] = orthologs, get_ortholog_genenames_overview(original=data[gene_column], orthologs=orthologs,
+                                                                  removed_gene_names=removed[tar])
+    return results
 
 
 def get_orthologs(ids, handler, organism: str, tar_organism: str):
@@ -69,20 +133,66 @@ def get_orthologs(ids, handler, organism: str, tar_organism: str):
         return ';'.join(orthologs)
 
 
+def get_orthologs_bulk(ids: pd.Series, handler, organism: str, tar_organism: str) -> pd.Series:
+    """
+    Get orthologs of all rows in one pass. Gives the same result as applying get_orthologs on each row. Each
+    distinct cell is mapped once, cells mapped in earlier calls on the same handler are taken from its cell cache.
+
+    :param ids: Series with semicolon separated gene names per row
+    :param handler: Handler for mappings
+    :param organism: Organism of the input ids
+    :param tar_organism: Organism to map to
+    :return: Series with ortholog gene names per row
+    """
+    return map_cells(ids, transform=lambda cells: get_orthologs_cells(ids=cells, handler=handler, organism=organism,
+                                                                      tar_organism=tar_organism),
+                     cache=handler.cell_cache, key=("orthologs", "orthologs", organism, tar_organism))
+
+
+def get_orthologs_cells(ids: pd.Series, handler, organism: str, tar_organism: str) -> pd.Series:
+    """
+    Get orthologs of the given cells in one vectorized pass.
+
+    :param ids: Series with semicolon separated gene names per cell
+    :param handler: Handler for mappings
+    :param organism: Organism of the input ids
+    :param tar_organism: Organism to map to
+    :return: Series with ortholog gene names per cell
+    """
+    # ==== Join gene names of all cells with the mapping once ====
+    split = split_ids(ids, name="source_symbol").drop_duplicates()
+    mapping, _ = handler.get_preloaded(in_list=split["source_symbol"].cat.categories, in_type="orthologs",
+                                       organism=organism, tar_organism=tar_organism)
+    # ==== Merge on the integer codes of the split IDs ====
+    mapping = mapping[["source_symbol", "target_symbol"]].astype({"source_symbol": split["source_symbol"].dtype})
+    mapping = split.merge(mapping, on="source_symbol", how="inner")
+    mapping = mapping[mapping["target_symbol"].notna() & ~mapping["target_symbol"].isin(["N/A", "None"])]
+    return join_ids(mapping, column=ids, name="target_symbol")
+
+
 if __name__ == "__main__":
     description = "                       Map ortholog gene names in data file."
     parameters = ru.save_parameters(script_desc=description,
-                                    arguments=('d','gc_req','or_req','tor_req','ke','rc','o'))
-    df, log = map_orthologs(data=parameters.data, gene_column=parameters.gene_column,organism=parameters.organism,
-                            tar_organism=parameters.tar_organism, keep_empty=parameters.keep_empty,
-                            res_column=parameters.res_column)
-
-    df.to_csv(parameters.out_dir + Path( parameters.file_name ).stem + "_ortholog.txt", header=True, index=False,
-              quoting=csv.QUOTE_NONNUMERIC, sep=" ")
-    log[ "Overview_Log" ].to_csv(
-        parameters.out_dir + Path( parameters.file_name ).stem + "_ortholog_overview_log.txt",
-        header=True, index=False, quoting=csv.QUOTE_NONNUMERIC, sep=" " )
-    log[ "Detailed_Log" ].to_csv(
-        parameters.out_dir + Path( parameters.file_name ).stem + "_ortholog_detailed_log.txt",
-        header=True, index=False, quoting=csv.QUOTE_NONNUMERIC, sep=" " )
-
+                                    arguments=('d','gc_req','or_req','tor_req','ke','rc','md','of','cs','nj','o'))
+    tar_organisms = parameters.tar_organism
+    # ==== One handler for all chunks in streaming mode ====
+    handler = mh.MappingHandler(mapping_dir=parameters.mapping_dir, expiry_days=parameters.expiry_days,
+                                ortholog_file=parameters.ortholog_file,
+                                ortholog_fallback=parameters.ortholog_fallback)
+    out_file = parameters.out_dir + Path(parameters.file_name).stem
+
+    def process(data):
+        df, log = map_orthologs(data=data, gene_column=parameters.gene_column, organism=parameters.organism,
+                                tar_organism=tar_organisms[0] if len(tar_organisms) == 1 else tar_organisms,
+                                keep_empty=parameters.keep_empty, res_column=parameters.res_column, handler=handler,
+                                n_jobs=parameters.n_jobs)
+        # ==== One set of logs per target organism ====
+        logs = {"": log} if len(tar_organisms) == 1 else {f"_{tar}": log[tar] for tar in tar_organisms}
+        return df, {suffix + name: x for suffix, log in logs.items() for name, x in log.items()}
+
+    suffixes = [""] if len(tar_organisms) == 1 else [f"_{tar}" for tar in tar_organisms]
+    files = {"Data": out_file + "_ortholog.txt"}
+    for suffix in suffixes:
+        files[suffix + "Overview_Log"] = out_file + suffix + "_ortholog_overview_log.txt"
+        files[suffix + "Detailed_Log"] = out_file + suffix + "_ortholog_detailed_log.txt"
+    ru.write_results(data=parameters.data, process=process, files=files)
@@ -1,73 +1,134 @@
 #!/usr/bin/python3
 
 
-import httplib2 as http
-import json
+import os
+import pickle
+import threading
+import time
+import requests
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from ratelimit import limits, sleep_and_retry
-
-try:
-    from urlparse import urlparse
-except ImportError:
-    from urllib.parse import urlparse
+from .index_utils import get_index_file
 
 # 10 calls per second
 CALLS = 10
 RATE_LIMIT = 1
 
+# ==== Transient errors are retried with exponential backoff ====
+MAX_RETRIES = 3
+RETRY_STATUS = (429, 500, 502, 503, 504)
 
-@sleep_and_retry
-@limits(calls=CALLS, period=RATE_LIMIT)
-def get_HGNC_mapping(id, request="symbol"):
-    headers = {
-        'Accept': 'application/json',
-    }
-
-    output = pd.DataFrame()
-
-    uri = 'http://rest.genenames.org'
-    path = '/fetch/' + request + '/' + id
-
-    target = urlparse(uri + path)
-    method = 'GET'
-    body = ''
+COLUMNS = ["Request Type", "Input", "HGNC ID", "Symbol", "Previous Symbol", "Alias Symbol"]
 
-    h = http.Http()
+# ==== Keep-alive session per thread ====
+_local = threading.local()
 
-    response, content = h.request(
-        target.geturl(),
-        method,
-        body,
-        headers)
 
-    if response['status'] == '200':
-        status = "success"
-    else:
-        print('Error detected: ' + response['status'])
-        status = "error"
-        return None
-
-    if status == "success":
-        data = json.loads(content)
+def _get_session():
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+        _local.session.headers.update({'Accept': 'application/json'})
+    return _local.session
 
-        if (len(data["response"]["docs"]) == 0):
-            return None
-        else:
-            for entry in data["response"]["docs"]:
-                hgnc_id = entry.get("hgnc_id", None)
-                symbol = entry.get("symbol", None)
-                prev = entry.get("prev_symbol", None)
-                alias = entry.get("alias_symbol", None)
 
-                if prev is not None:
-                    prev = ";".join(prev)
-
-                if alias is not None:
-                    alias = ";".join(alias)
+@sleep_and_retry
+@limits(calls=CALLS, period=RATE_LIMIT)
+def _fetch_HGNC(id, request="symbol"):
+    return _get_session().get('http://rest.genenames.org/fetch/' + request + '/' + id)
+
+
+def get_HGNC_records(id, request="symbol"):
+    """
+    Get HGNC entries of one ID.
+
+    :param id: Gene name
+    :param request: Field to search the gene name in (symbol, alias_symbol, prev_symbol)
+    :return: List of records with the keys of COLUMNS, empty if HGNC has no entry
+    :raises requests.HTTPError: If the request still fails after MAX_RETRIES retries, so that a failed request is
+                                not taken for a gene name without entry
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        response = _fetch_HGNC(id, request)
+        if response.status_code not in RETRY_STATUS or attempt == MAX_RETRIES:
+            break
+        time.sleep(2 ** attempt)
+    if response.status_code == 404:
+        return []
+    response.raise_for_status()
+    records = list()
+    for entry in response.json()["response"]["docs"]:
+        prev = entry.get("prev_symbol", None)
+        alias = entry.get("alias_symbol", None)
+        records.append({"Request Type": request, "Input": id, "HGNC ID": entry.get("hgnc_id", None),
+                        "Symbol": entry.get("symbol", None),
+                        "Previous Symbol": ";".join(prev) if prev is not None else None,
+                        "Alias Symbol": ";".join(alias) if alias is not None else None})
+    return records
 
-                output_chunk = pd.Series([request, id, hgnc_id, symbol, prev, alias])
-                output = pd.concat([output, output_chunk], axis=1)
 
-            output = output.T
-            output.columns = ["Request Type", "Input", "HGNC ID", "Symbol", "Previous Symbol", "Alias Symbol"]
-            return (output)
+def get_HGNC_mapping(id, request="symbol"):
+    records = get_HGNC_records(id, request)
+    if not records:
+        return None
+    return pd.DataFrame(records, columns=COLUMNS)
+
+
+def get_HGNC_mappings(ids, request_types=("alias_symbol", "symbol"), n_workers=4) -> pd.DataFrame:
+    """
+    Get HGNC entries of all IDs for each request type. Duplicate IDs are requested once, and requests are sent
+    from a pool of n_workers threads that together stay within the HGNC rate limit.
+
+    :param ids: List of gene names
+    :param request_types: Fields to search the gene names in
+    :param n_workers: Number of concurrent requests
+    :return: Dataframe with COLUMNS, ordered by ID and request type
+    """
+    tasks = [(id, request) for id in dict.fromkeys(ids) for request in request_types]
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        results = executor.map(lambda task: get_HGNC_records(*task), tasks)
+        records = [record for result in results if result for record in result]
+    return pd.DataFrame(records, columns=COLUMNS)
+
+
+def load_HGNC_complete_set(hgnc_file: str, cache: bool = True, index_dir: str = None) -> dict:
+    """
+    Build an index of the HGNC complete set file that maps each symbol, alias symbol and previous symbol to the
+    approved symbols it belongs to.
+
+    :param hgnc_file: HGNC complete set file (hgnc_complete_set.txt)
+    :param cache: Set True to save the index and load it from there in later calls
+    :param index_dir: Directory to save the index in. If None, it is saved next to the file.
+    :return: Dictionary with request type (symbol, alias_symbol, prev_symbol) -> name -> list of approved symbols
+    """
+    cache_file = get_index_file(source=hgnc_file, suffix=".index.pkl", index_dir=index_dir)
+    if cache and os.path.exists(cache_file) and os.path.getmtime(cache_file) >= os.path.getmtime(hgnc_file):
+        with open(cache_file, "rb") as f:
+            return pickle.load(f)
+    complete_set = pd.read_csv(hgnc_file, sep="\t", dtype=str)
+    # ==== Only approved entries are returned by the REST API ====
+    if "status" in complete_set.columns:
+        complete_set = complete_set[complete_set["status"] == "Approved"]
+    index = {"symbol": {x: [x] for x in complete_set["symbol"].dropna()}}
+    for request in ["alias_symbol", "prev_symbol"]:
+        names = complete_set[["symbol", request]].dropna()
+        names = names.assign(**{request: names[request].str.strip('"').str.split("|")}).explode(request)
+        index[request] = names.groupby(request, sort=False)["symbol"].agg(list).to_dict()
+    if cache:
+        with open(cache_file, "wb") as f:
+            pickle.dump(index, f)
+    return index
+
+
+def get_HGNC_mappings_local(ids, index: dict, request_types=("alias_symbol", "symbol")) -> pd.DataFrame:
+    """
+    Get HGNC entries of all IDs from a loaded HGNC complete set, like get_HGNC_mappings does with the REST API.
+
+    :param ids: List of gene names
+    :param index: HGNC complete set index as returned by load_HGNC_complete_set
+    :param request_types: Fields to search the gene names in
+    :return: Dataframe with the columns Request Type, Input and Symbol, ordered by ID and request type
+    """
+    records = [(request, id, symbol) for id in dict.fromkeys(ids) for request in request_types
+               for symbol in index[request].get(id, [])]
+    return pd.DataFrame(records, columns=["Request Type", "Input", "Symbol"])
@@ -1,5 +1,14 @@
 from . import HGNC_mapping
+from . import cell_cache
+from . import gprofiler_client
 from . import logger
+from . import mapping_cache
 from . import mapping_handler
+from . import mapping_store
+from . import mapping_table
+from . import ortholog_index
+from . import parallel_utils
 from . import plotting
-from . import runner_utils
\ No newline at end of file
+from . import runner_utils
+from . import table_utils
+from . import uniprot_index
@@ -0,0 +1,104 @@
+#!/usr/bin/python3
+
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+
+class CellCache:
+    """
+    Least recently used cache of transformed ID cells. Results are stored per transform key (mapping type, transform
+    and its options) and cell string, so cells repeated across rows, chunks and calls on the same handler are only
+    transformed once.
+    """
+
+    def __init__(self, maxsize: int = 100000):
+        """
+        :param maxsize: Max number of cached cells over all transforms. If 0, nothing is cached.
+        """
+        self.maxsize = maxsize
+        self._results = OrderedDict()
+
+    def __len__(self):
+        return len(self._results)
+
+    def get(self, key: tuple, cells) -> dict:
+        """
+        Get cached results of the given cells and mark them as recently used.
+
+        :param key: Transform key, starting with the mapping type the transform reads
+        :param cells: Distinct cells
+        :return: Dictionary with the result of each cached cell
+        """
+        results = dict()
+        for cell in cells:
+            result = self._results.get((key, cell))
+            if result is not None:
+                self._results.move_to_end((key, cell))
+                results[cell] = result
+        return results
+
+    def add(self, key: tuple, results: dict):
+        """
+        Add results of cells and drop the least recently used cells above maxsize.
+
+        :param key: Transform key, starting with the mapping type the transform reads
+        :param results: Dictionary with the result of each cell
+        """
+        if self.maxsize <= 0:
+            return
+        for cell, result in results.items():
+            self._results[(key, cell)] = result
+            self._results.move_to_end((key, cell))
+        while len(self._results) > self.maxsize:
+            self._results.popitem(last=False)
+
+    def discard(self, in_type: str, ids):
+        """
+        Remove results of cells containing any of the given IDs, e.g. after new mapping rows of these IDs were added.
+
+        :param in_type: Mapping type [protein, orthologs, reduced_genes] the IDs were mapped for
+        :param ids: Protein IDs or gene names with new mapping rows
+        """
+        ids = set(ids)
+        if len(ids) == 0:
+            return
+        for cache_key in [x for x in self._results
+                          if x[0][0] == in_type and not ids.isdisjoint(x[1].split(";"))]:
+            del self._results[cache_key]
+
+    def clear(self, in_type: str = None):
+        """
+        Remove cached results.
+
+        :param in_type: Mapping type [protein, orthologs, reduced_genes] whose transforms are removed. If None, all
+                        results are removed.
+        """
+        if in_type is None:
+            self._results.clear()
+        else:
+            for cache_key in [x for x in self._results if x[0][0] == in_type]:
+                del self._results[cache_key]
+
+
+def map_cells(ids: pd.Series, transform, cache: CellCache = None, key: tuple = None) -> pd.Series:
+    """
+    Apply a row-level transform once per distinct cell and broadcast the results to all rows with that cell. Cells
+    found in the cache are not transformed again, newly transformed cells are added to it.
+
+    :param ids: Series with semicolon separated IDs per row
+    :param transform: Function getting a series of distinct cells and returning a series of results aligned to it
+    :param cache: Cache shared across calls, e.g. the cell_cache of a MappingHandler. If None, nothing is cached.
+    :param key: Transform key of the results in the cache, starting with the mapping type the transform reads
+    :return: Series aligned to ids with the result per row
+    """
+    codes, cells = pd.factorize(ids.astype(str))
+    results = cache.get(key, cells) if cache is not None else dict()
+    todo = [x for x in cells if x not in results]
+    if len(todo) > 0:
+        computed = dict(zip(todo, transform(pd.Series(todo, dtype=object)).to_numpy()))
+        if cache is not None:
+            cache.add(key, computed)
+        results.update(computed)
+    values = np.array([results[x] for x in cells], dtype=object)
+    return pd.Series(values[codes], index=ids.index, dtype=object)
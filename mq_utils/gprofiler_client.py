@@ -0,0 +1,71 @@
+#!/usr/bin/python3
+
+import requests
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_URL = 'https://biit.cs.ut.ee/gprofiler'
+CONVERT_COLUMNS = ['incoming', 'converted', 'n_incoming', 'n_converted', 'name', 'description', 'namespaces',
+                   'query']
+ORTH_COLUMNS = ['incoming', 'converted', 'ortholog_ensg', 'n_incoming', 'n_converted', 'n_result', 'name',
+                'description', 'namespaces']
+
+
+class GProfilerClient:
+    """
+    Client for g:Convert and g:Orth that splits large queries into batches, sends them concurrently over one
+    keep-alive session and returns the results in input order, like GProfiler(return_dataframe=True) does.
+    """
+
+    def __init__(self, batch_size: int = 1000, n_workers: int = 4, base_url: str = BASE_URL):
+        """
+        :param batch_size: Number of IDs per request
+        :param n_workers: Number of concurrent requests
+        :param base_url: URL of the g:Profiler service
+        """
+        self.batch_size = batch_size
+        self.n_workers = n_workers
+        self.base_url = base_url
+        self.session = requests.Session()
+        self.session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=n_workers))
+
+    def post(self, tool: str, payload: dict) -> list:
+        r = self.session.post('{}/api/{}'.format(self.base_url, tool), json=payload,
+                              headers={'User-Agent': 'gprofiler-python/MaxQuantHandler'})
+        if r.status_code != 200:
+            try:
+                message = r.json()['message']
+            except (ValueError, KeyError):
+                message = 'query failed with error {}'.format(r.status_code)
+            raise AssertionError(message)
+        return r.json()['result']
+
+    def query_batches(self, tool: str, query: list, payload: dict, columns: list) -> pd.DataFrame:
+        """
+        Send query in batches of batch_size IDs and combine the results in input order.
+
+        :param tool: Tool path of the API, e.g. convert/convert
+        :param query: List of IDs
+        :param payload: Request parameters besides the query
+        :param columns: Columns of the resulting dataframe
+        :return: Dataframe with results of all batches
+        """
+        batches = [query[i:i + self.batch_size] for i in range(0, len(query), self.batch_size)]
+        with ThreadPoolExecutor(max_workers=self.n_workers) as executor:
+            results = executor.map(lambda batch: self.post(tool, {**payload, 'query': batch}), batches)
+            records = [record for result in results for record in result]
+        return pd.DataFrame(records).reindex(columns=columns)
+
+    def convert(self, query: list, organism: str = 'hsapiens', target_namespace: str = 'ENSG',
+                numeric_namespace: str = 'ENTREZGENE') -> pd.DataFrame:
+        return self.query_batches('convert/convert', query,
+                                  {'organism': organism, 'target': target_namespace,
+                                   'numeric_ns': numeric_namespace, 'output': 'json'},
+                                  columns=CONVERT_COLUMNS)
+
+    def orth(self, query: list, organism: str = 'hsapiens', target: str = 'mmusculus',
+             numeric_namespace: str = 'ENTREZGENE') -> pd.DataFrame:
+        return self.query_batches('orth/orth', query,
+                                  {'organism': organism, 'target': target, 'numeric_ns': numeric_namespace,
+                                   'aresolve': None, 'output': 'json'},
+                                  columns=ORTH_COLUMNS)
@@ -0,0 +1,22 @@
+#!/usr/bin/python3
+
+import hashlib
+import os
+
+
+def get_index_file(source: str, suffix: str, index_dir: str = None) -> str:
+    """
+    Get the path of the index built from a local mapping file.
+
+    :param source: Local mapping file the index is built from
+    :param suffix: Suffix of the index file, e.g. '.index.db'
+    :param index_dir: Directory to save the index in, e.g. the mapping directory. If None, the index is saved next
+                      to the mapping file.
+    :return: Path of the index file
+    """
+    if index_dir is None:
+        return source + suffix
+    os.makedirs(index_dir, exist_ok=True)
+    # ==== Mapping files with the same name in different directories get their own index ====
+    key = hashlib.blake2b(os.path.abspath(source).encode(), digest_size=8).hexdigest()
+    return os.path.join(index_dir, f"{os.path.basename(source)}.{key}{suffix}")
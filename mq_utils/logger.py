@@ -4,7 +4,7 @@ import pandas as pd
 
 
 # ==== Logging DataFrame For Filtering Ids ====
-def get_filter_ids_logging(original, filtered, handler, organism):
+def get_filter_ids_overview(original, filtered):
     # ==== create dataframe with for each row original ids, filtered ids, nr ids, etc. ====
     log_df = pd.DataFrame({"IDs": original.str.split(";"), "Filtered IDs": filtered.str.split(";")})
     log_df["Removed IDs"] = log_df.apply(
@@ -12,6 +12,12 @@ def get_filter_ids_logging(original, filtered, handler, organism):
     log_df["Nr IDs"] = log_df["IDs"].apply(lambda x: len(list(filter(None, x))))
     log_df["Nr Filtered IDs"] = log_df["Filtered IDs"].apply(lambda x: len(list(filter(None, x))))
     log_df["Nr Removed IDs"] = log_df["Nr IDs"] - log_df["Nr Filtered IDs"]
+    return log_df
+
+
+def get_filter_ids_logging(original, filtered, handler, organism, overview=None):
+    # ==== Overview may be built beforehand, e.g. in parts by worker processes ====
+    log_df = get_filter_ids_overview(original, filtered) if overview is None else overview
 
     # ==== for removed ids --> find out the cause and create df ====
     if sum(log_df["Nr Removed IDs"]) == 0:
@@ -28,7 +34,7 @@ def get_filter_ids_logging(original, filtered, handler, organism):
 
 
 # ==== Logging DataFrame For Remapped Gene Names ====
-def get_remapped_genenames_logging(original, remapped, protein_ids, handler, organism):
+def get_remapped_genenames_overview(original, remapped):
     # ==== create dataframe with for each row original names, remapped names, nr names, etc. ====
     log_df = pd.DataFrame({"Gene Names": original.str.split(";"), "Remapped Gene Names": remapped.str.split(";")})
     log_df["Added Gene Names"] = log_df.apply(
@@ -39,6 +45,12 @@ def get_remapped_genenames_logging(original, remapped, protein_ids, handler, org
     log_df["Nr Remapped Gene Names"] = log_df["Remapped Gene Names"].apply(lambda x: len(list(filter(None, x))))
     log_df["Nr Added Gene Names"] = log_df["Added Gene Names"].apply(lambda x: len(list(filter(None, x))))
     log_df["Nr Removed Gene Names"] = log_df["Removed Gene Names"].apply(lambda x: len(list(filter(None, x))))
+    return log_df
+
+
+def get_remapped_genenames_logging(original, remapped, protein_ids, handler, organism, overview=None):
+    # ==== Overview may be built beforehand, e.g. in parts by worker processes ====
+    log_df = get_remapped_genenames_overview(original, remapped) if overview is None else overview
 
     # ==== for added names --> find out the cause and create df ====
     df, missing = handler.get_preloaded(in_list=protein_ids, in_type="protein", organism=organism)
@@ -47,10 +59,7 @@ def get_remapped_genenames_logging(original, remapped, protein_ids, handler, org
 
 
 # ==== Logging DataFrame For Reducing Gene Names ====
-def get_reduced_genenames_logging(original, reduced, handler, organism, mode):
-    # ==== Get Information for all original names ====
-    df, missing = handler.get_preloaded(in_list=original, in_type="reduced_genes",
-                                        organism=organism, reduction_mode=mode)
+def get_reduced_genenames_overview(original, reduced):
     # ==== create dataframe with for each row original names, reduced names, nr names, etc. ====
     log_df = pd.DataFrame({"Gene Names": original.str.split(";"), "Reduced Gene Names": reduced.str.split(";")})
     log_df["Added Gene Names"] = log_df.apply(
@@ -61,6 +70,15 @@ def get_reduced_genenames_logging(original, reduced, handler, organism, mode):
     log_df["Nr Reduced Gene Names"] = log_df["Reduced Gene Names"].apply(lambda x: len(list(filter(None, x))))
     log_df["Nr Added Gene Names"] = log_df["Added Gene Names"].apply(lambda x: len(list(filter(None, x))))
     log_df["Nr Removed Gene Names"] = log_df["Removed Gene Names"].apply(lambda x: len(list(filter(None, x))))
+    return log_df
+
+
+def get_reduced_genenames_logging(original, reduced, handler, organism, mode, overview=None):
+    # ==== Get Information for all original names ====
+    df, missing = handler.get_preloaded(in_list=original, in_type="reduced_genes",
+                                        organism=organism, reduction_mode=mode)
+    # ==== Overview may be built beforehand, e.g. in parts by worker processes ====
+    log_df = get_reduced_genenames_overview(original, reduced) if overview is None else overview
 
     # ==== for reduced ids --> find out the cause and create df ====
     df = pd.concat([df, pd.DataFrame({"Gene Name": missing})], ignore_index=True).fillna("Not found")
@@ -69,15 +87,17 @@ def get_reduced_genenames_logging(original, reduced, handler, organism, mode):
 
 
 # ==== Logging DataFrame For Remapped Gene Names ====
-def get_ortholog_genenames_logging(original, orthologs, handler, organism, tar_organism):
+def get_ortholog_removed(original, handler, organism, tar_organism):
     # ==== Get Information for all original names ====
     original_names = [x for x in ";".join(original).split(";") if str(x) != 'nan']
     df, missing = handler.get_preloaded(in_list=original_names, in_type="orthologs",
                                         organism=organism, tar_organism=tar_organism)
     df = df.fillna("")
     df = df[df["target_symbol"].isin(["", "N/A"])]
-    removed_gene_names = set(df["source_symbol"])
+    return df, missing
 
+
+def get_ortholog_genenames_overview(original, orthologs, removed_gene_names):
     # ==== create dataframe with for each row original names, ortholog names, nr names, etc. ====
     log_df = pd.DataFrame({"Gene Names": original.str.split(";"), "Ortholog Gene Names": orthologs.str.split(";")})
     log_df["Removed Gene Names"] = log_df.apply(
@@ -85,6 +105,15 @@ def get_ortholog_genenames_logging(original, orthologs, handler, organism, tar_o
     log_df["Nr Gene Names"] = log_df["Gene Names"].apply(lambda x: len(list(filter(None, x))))
     log_df["Nr Ortholog Gene Names"] = log_df["Ortholog Gene Names"].apply(lambda x: len(list(filter(None, x))))
     log_df["Nr Removed Gene Names"] = log_df["Removed Gene Names"].apply(lambda x: len(list(filter(None, x))))
+    return log_df
+
+
+def get_ortholog_genenames_logging(original, orthologs, handler, organism, tar_organism, overview=None):
+    df, missing = get_ortholog_removed(original, handler, organism, tar_organism)
+    removed_gene_names = set(df["source_symbol"])
+    # ==== Overview may be built beforehand, e.g. in parts by worker processes ====
+    log_df = get_ortholog_genenames_overview(original, orthologs, removed_gene_names) if overview is None \
+        else overview
 
     # ==== for removed ids --> find out the cause and create df ====
     if len(removed_gene_names) == 0:
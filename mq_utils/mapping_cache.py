@@ -0,0 +1,167 @@
+#!/usr/bin/python3
+
+import sqlite3
+import time
+import pandas as pd
+
+# ==== Columns and key columns of the cached mapping tables ====
+TABLES = {
+    "protein": {"table": "protein_mapping",
+                "columns": ['Gene Names', 'Gene Names (primary)', 'Reviewed', 'Organism', 'Protein ID'],
+                "keys": ['Protein ID']},
+    "orthologs": {"table": "ortholog_mapping",
+                  "columns": ['source_symbol', 'source_organism', 'ensg', 'ortholog_ensg', 'target_symbol',
+                              'target_organism', 'description'],
+                  "keys": ['source_symbol', 'source_organism', 'target_organism']},
+    "reduced_genes": {"table": "reduced_gene_mapping",
+                      "columns": ["Gene Name", "Reduced Gene Name", "Organism", "Mode"],
+                      "keys": ["Gene Name", "Organism", "Mode"]}
+}
+
+# ==== Columns of the cached IDs without any mapping ====
+MISSING_COLUMNS = ["ID", "Type", "Organism", "Target Organism", "Mode"]
+
+# ==== Max number of bound parameters per SQLite statement ====
+CHUNK_SIZE = 900
+
+
+class MappingCache:
+    """
+    Persistent SQLite store for fetched mappings. Each entry is saved with the time it was fetched.
+    Entries older than expiry_days are ignored when loading and replaced with the next fetch.
+    """
+
+    def __init__(self, path: str, expiry_days: float = None):
+        """
+        :param path: Path of the SQLite database file
+        :param expiry_days: Number of days after which cached entries are refetched. If None, entries never expire.
+        """
+        self.path = path
+        self.expiry_days = expiry_days
+        self._connection = None
+
+    @property
+    def connection(self):
+        # ==== Open database only when first needed ====
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path)
+            for info in TABLES.values():
+                columns = ", ".join(f'"{x}" TEXT' for x in info["columns"])
+                self._connection.execute(f'CREATE TABLE IF NOT EXISTS {info["table"]} ({columns}, "Fetched" REAL)')
+                keys = ", ".join(f'"{x}"' for x in info["keys"])
+                self._connection.execute(f'CREATE INDEX IF NOT EXISTS {info["table"]}_keys '
+                                         f'ON {info["table"]} ({keys})')
+            columns = ", ".join(f'"{x}" TEXT' for x in MISSING_COLUMNS)
+            self._connection.execute(f'CREATE TABLE IF NOT EXISTS missing_ids ({columns}, "Fetched" REAL)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS missing_ids_keys ON missing_ids ("ID", "Type")')
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def load(self, ids, in_type: str, organism=None, tar_organism=None, reduction_mode="ensembl") -> pd.DataFrame:
+        """
+        Load cached, not expired mappings of given IDs.
+
+        :param ids: Set of either protein IDs or gene names
+        :param in_type: Type of needed mapping [protein, orthologs, reduced_genes]
+        :param organism: Organism of the input IDs (orthologs and reduced_genes only)
+        :param tar_organism: (Orthologs mode) Target organism
+        :param reduction_mode: (Reduced_genes mode) Mode of how to reduce the gene names
+        :return: Dataframe with cached mappings
+        """
+        info = TABLES[in_type]
+        ids = list(set(ids))
+        # ==== Restrict on organism, target organism and reduction mode ====
+        conditions, params = list(), list()
+        if in_type == "orthologs":
+            conditions += ['"source_organism" = ?', '"target_organism" = ?']
+            params += [organism, tar_organism]
+        elif in_type == "reduced_genes":
+            conditions += ['"Organism" = ?', '"Mode" = ?']
+            params += [organism, reduction_mode]
+        if self.expiry_days is not None:
+            conditions += ['"Fetched" >= ?']
+            params += [time.time() - self.expiry_days * 86400]
+        columns = ", ".join(f'"{x}"' for x in info["columns"])
+        chunks = list()
+        # ==== Query in chunks to stay below SQLite's parameter limit ====
+        for i in range(0, len(ids), CHUNK_SIZE):
+            ids_chunk = ids[i:i + CHUNK_SIZE]
+            where = " AND ".join([f'"{info["keys"][0]}" IN ({",".join("?" * len(ids_chunk))})'] + conditions)
+            chunks.append(pd.read_sql_query(f'SELECT {columns} FROM {info["table"]} WHERE {where}',
+                                            self.connection, params=ids_chunk + params))
+        if len(chunks) == 0:
+            return pd.DataFrame(columns=info["columns"])
+        mapping = pd.concat(chunks, ignore_index=True)
+        # ==== HGNC reductions are lists of symbols ====
+        if in_type == "reduced_genes" and reduction_mode == "HGNC":
+            mapping["Reduced Gene Name"] = mapping["Reduced Gene Name"].apply(
+                lambda x: x.split(";") if isinstance(x, str) else None)
+        return mapping
+
+    def save(self, mapping: pd.DataFrame, in_type: str):
+        """
+        Save new mappings and replace previously cached entries with the same keys.
+
+        :param mapping: Dataframe with fetched mappings
+        :param in_type: Type of mapping [protein, orthologs, reduced_genes]
+        """
+        if mapping.empty:
+            return
+        info = TABLES[in_type]
+        mapping = mapping[info["columns"]].copy()
+        # ==== HGNC reductions are lists of symbols ====
+        if in_type == "reduced_genes":
+            mapping["Reduced Gene Name"] = mapping["Reduced Gene Name"].apply(
+                lambda x: ";".join(x) if isinstance(x, list) else x)
+        mapping = mapping.astype(object).where(mapping.notna(), None)
+        mapping["Fetched"] = time.time()
+        keys = mapping[info["keys"]].drop_duplicates()
+        with self.connection:
+            where = " AND ".join(f'"{x}" = ?' for x in info["keys"])
+            self.connection.executemany(f'DELETE FROM {info["table"]} WHERE {where}',
+                                        keys.itertuples(index=False, name=None))
+            placeholders = ",".join("?" * len(mapping.columns))
+            columns = ", ".join(f'"{x}"' for x in mapping.columns)
+            self.connection.executemany(f'INSERT INTO {info["table"]} ({columns}) VALUES ({placeholders})',
+                                        mapping.itertuples(index=False, name=None))
+
+    def load_missing(self, ids, key: tuple) -> dict:
+        """
+        Load IDs that were confirmed to have no mapping, together with the time they were checked.
+
+        :param ids: Set of either protein IDs or gene names
+        :param key: Tuple of type, organism, target organism and reduction mode the IDs were requested for
+        :return: Dictionary with missing IDs and the time they were checked
+        """
+        ids = list(set(ids))
+        # ==== NULL safe comparison as organism, target organism and mode are not set for all types ====
+        conditions = " AND ".join(f'"{x}" IS ?' for x in MISSING_COLUMNS[1:])
+        missing = dict()
+        for i in range(0, len(ids), CHUNK_SIZE):
+            ids_chunk = ids[i:i + CHUNK_SIZE]
+            rows = self.connection.execute(f'SELECT "ID", "Fetched" FROM missing_ids '
+                                           f'WHERE "ID" IN ({",".join("?" * len(ids_chunk))}) AND {conditions}',
+                                           ids_chunk + list(key))
+            missing.update(rows)
+        return missing
+
+    def save_missing(self, ids, key: tuple, fetched: float):
+        """
+        Save IDs that were confirmed to have no mapping and replace previous entries.
+
+        :param ids: Set of either protein IDs or gene names
+        :param key: Tuple of type, organism, target organism and reduction mode the IDs were requested for
+        :param fetched: Time the IDs were checked
+        """
+        if len(ids) == 0:
+            return
+        conditions = " AND ".join(f'"{x}" IS ?' for x in MISSING_COLUMNS)
+        with self.connection:
+            self.connection.executemany(f'DELETE FROM missing_ids WHERE {conditions}',
+                                        [(x, *key) for x in ids])
+            self.connection.executemany('INSERT INTO missing_ids VALUES (?, ?, ?, ?, ?, ?)',
+                                        [(x, *key, fetched) for x in ids])
@@ -1,33 +1,148 @@
 #!/usr/bin/python3
 
-from os.path import dirname, abspath, join
+import copy
+import io
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from os.path import join
 import pandas as pd
 from pathlib import Path
 from gprofiler import GProfiler
 import requests
-from .HGNC_mapping import get_HGNC_mapping
+from .HGNC_mapping import get_HGNC_mappings, get_HGNC_mappings_local, load_HGNC_complete_set
+from .cell_cache import CellCache
+from .gprofiler_client import GProfilerClient
+from .mapping_cache import MappingCache
+from .mapping_store import export_mapping_table
+from .mapping_table import MappingTable
+from .ortholog_index import OrthologIndex
+from .uniprot_index import UniProtIndex
 import mygene
 import numpy as np
 
-here = dirname(dirname(abspath(__file__)))  # needed to make files reachable in python package
-
 
 class MappingHandler:
-    full_protein_mapping = pd.DataFrame(columns=['Gene Names', 'Gene Names (primary)', 'Reviewed', 'Organism',
-                                                 'Protein ID'])
-    full_ortholog_mapping = pd.DataFrame(columns=['source_symbol', 'source_organism', 'ensg', 'ortholog_ensg',
-                                                  'target_symbol', 'target_organism', 'description'])
-    full_reduced_gene_mapping = pd.DataFrame(columns=["Gene Name", "Reduced Gene Name", "Organism", "Mode"])
-
-    # def __init__(self, mapping_dir):
-    #     mapping_dir = join(here, mapping_dir)
-    #     if Path(mapping_dir + "protein_to_genenames.csv").exists():
-    #         self.full_protein_mapping = pd.read_csv(mapping_dir + "protein_to_genenames.csv")
-    #     if Path(mapping_dir + "genenames_to_orthologs.csv").exists():
-    #         self.full_ortholog_mapping = pd.read_csv(mapping_dir + "genenames_to_orthologs.csv")
-    #     if Path(mapping_dir + "genenames_to_reduced_genenames.csv").exists():
-    #         self.full_reduced_gene_mapping = pd.read_csv(mapping_dir + "genenames_to_reduced_genenames.csv",
-    #                                                      na_values=None)
+
+    def __init__(self, mapping_dir: str = None, expiry_days: float = None, n_workers: int = 4,
+                 uniprot_chunk_size: int = 500, uniprot_file: str = None, hgnc_file: str = None,
+                 mygene_batch_size: int = 1000, gprofiler_batch_size: int = 1000, ortholog_file: str = None,
+                 ortholog_mmap: bool = True, ortholog_fallback: bool = False, cell_cache_size: int = 100000):
+        """
+        Handler for prefetched mappings. If mapping_dir is set, fetched mappings are persisted there and loaded
+        on demand in later runs instead of being requested again.
+
+        :param mapping_dir: Directory of the persistent mapping cache and of the indexes of local mapping files. If
+                            None, mappings are kept in memory only and indexes are built next to the local files.
+        :param expiry_days: Number of days after which cached mappings are fetched again. If None, they never expire.
+        :param n_workers: Number of concurrent requests to the web services
+        :param uniprot_chunk_size: Number of protein IDs per UniProt request
+        :param uniprot_file: Local UniProt FASTA or TSV export to use instead of the UniProt REST API
+        :param hgnc_file: Local HGNC complete set file to use instead of the HGNC REST API
+        :param mygene_batch_size: Number of gene names per mygene.info query
+        :param gprofiler_batch_size: Number of gene names per g:Convert and g:Orth request
+        :param ortholog_file: Local ortholog table to use instead of gProfiler g:Orth
+        :param ortholog_mmap: Set True to memory-map the index of the local ortholog table
+        :param ortholog_fallback: Set True to request gene names missing in the local ortholog table from gProfiler
+        :param cell_cache_size: Max number of transformed ID cells remembered across calls. If 0, cells are only
+                                de-duplicated within one call.
+        """
+        self.uniprot_index = UniProtIndex(uniprot_file=uniprot_file, index_dir=mapping_dir) \
+            if uniprot_file is not None else None
+        self.ortholog_index = OrthologIndex(ortholog_file=ortholog_file, mmap=ortholog_mmap, index_dir=mapping_dir) \
+            if ortholog_file is not None else None
+        self.ortholog_fallback = ortholog_fallback
+        self.hgnc_index = load_HGNC_complete_set(hgnc_file=hgnc_file, index_dir=mapping_dir) \
+            if hgnc_file is not None else None
+        self.n_workers = n_workers
+        # ==== IDs rejected by UniProt, not requested again ====
+        self.invalid_protein_ids = set()
+        self.uniprot_chunk_size = uniprot_chunk_size
+        self.mygene_batch_size = mygene_batch_size
+        self.gprofiler = GProfilerClient(batch_size=gprofiler_batch_size, n_workers=n_workers)
+        # ==== Keep-alive session shared by all requests ====
+        self.session = requests.Session()
+        self.session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=n_workers))
+        self.protein_table = MappingTable(columns=['Gene Names', 'Gene Names (primary)', 'Reviewed', 'Organism',
+                                                   'Protein ID'],
+                                          keys=['Protein ID'], categories=['Reviewed', 'Organism'])
+        self.ortholog_table = MappingTable(columns=['source_symbol', 'source_organism', 'ensg', 'ortholog_ensg',
+                                                    'target_symbol', 'target_organism', 'description'],
+                                           keys=['source_symbol', 'source_organism', 'target_organism'],
+                                           categories=['source_organism', 'target_organism'])
+        self.reduced_gene_table = MappingTable(columns=["Gene Name", "Reduced Gene Name", "Organism", "Mode"],
+                                               keys=["Gene Name", "Organism", "Mode"],
+                                               categories=["Organism", "Mode"])
+        # ==== IDs without any mapping per type, organism, target organism and mode with time of check ====
+        self.missing_ids = dict()
+        self.checked_missing_ids = dict()
+        self.expiry_days = expiry_days
+        # ==== Transformed ID cells, invalidated when mapping rows of their IDs are added ====
+        self.cell_cache = CellCache(maxsize=cell_cache_size)
+        # ==== Temporary directory with the last export of each table and its version ====
+        self.store_dir = None
+        self.exported_tables = dict()
+        self.cache = None
+        if mapping_dir is not None:
+            Path(mapping_dir).mkdir(parents=True, exist_ok=True)
+            self.cache = MappingCache(path=join(mapping_dir, "mappings.db"), expiry_days=expiry_days)
+
+    def __getstate__(self):
+        # ==== Copies for worker processes are read-only snapshots of the mappings without connections ====
+        state = self.__dict__.copy()
+        state.update(cache=None, session=None, gprofiler=None, uniprot_index=None, ortholog_index=None,
+                     store_dir=None, exported_tables=dict())
+        return state
+
+    def export_store(self, directory: str = None):
+        """
+        Export the mappings to memory-mapped arrays in directory and get a read-only handler on them. Worker processes
+        attach to the arrays instead of receiving a copy of the mapping tables.
+
+        :param directory: Directory to write the arrays to. If None, they are written to a temporary directory of the
+                          handler, and tables not changed since their last export there are not written again.
+        :return: Read-only MappingHandler with the exported mappings
+        """
+        snapshot = copy.copy(self)
+        snapshot.__dict__.update(self.__getstate__())
+        for name in ["protein_table", "ortholog_table", "reduced_gene_table"]:
+            if directory is not None:
+                setattr(snapshot, name, export_mapping_table(getattr(self, name), join(directory, name)))
+            else:
+                setattr(snapshot, name, self.get_exported_table(name))
+        return snapshot
+
+    def get_exported_table(self, name: str):
+        """
+        Get the last export of a mapping table in the temporary directory of the handler, and export it again only if
+        rows were added since.
+
+        :param name: Attribute name of the table [protein_table, ortholog_table, reduced_gene_table]
+        :return: Read-only table on the exported arrays
+        """
+        table = getattr(self, name)
+        if self.store_dir is None:
+            self.store_dir = tempfile.TemporaryDirectory()
+        version, exported = self.exported_tables.get(name, (None, None))
+        if version != table.version:
+            if exported is not None:
+                shutil.rmtree(exported.directory, ignore_errors=True)
+            exported = export_mapping_table(table, join(self.store_dir.name, f"{name}_{table.version}"))
+            self.exported_tables[name] = (table.version, exported)
+        return exported
+
+    @property
+    def full_protein_mapping(self):
+        return self.protein_table.frame
+
+    @property
+    def full_ortholog_mapping(self):
+        return self.ortholog_table.frame
+
+    @property
+    def full_reduced_gene_mapping(self):
+        return self.reduced_gene_table.frame
 
     # === UniProt Mapping ====
     def get_uniprot_mapping(self, ids, organism: str = None):
@@ -40,32 +155,18 @@ class MappingHandler:
         """
         organisms = {"human": "Homo sapiens (Human)", "rat": "Rattus norvegicus (Rat)", "mouse": "Mus musculus (Mouse)",
                      "rabbit": "Oryctolagus cuniculus (Rabbit)"}
-        url = 'https://rest.uniprot.org/uniprotkb/accessions'
-        mapping = pd.DataFrame()
-        # ==== Get mappings in <= 500 IDs chunks ====
-        for i in range(0, len(ids), 500):
-            # ==== Remove contaminated and reverse mapped IDs ====
-            ids_chunk = [x for x in ids[i:i + 500] if not x.startswith(("REV", "CON"))]
-            params = {'format': 'tsv',
-                      'accessions': ",".join(ids_chunk),
-                      'fields': 'gene_names,gene_primary,reviewed,organism_name,accession'}
-            f = requests.get(url=url, params=params)
-            # ==== If at least one ID doesn't exist ====
-            if f.status_code == 400:
-                mapping_chunk = pd.DataFrame()
-                # ==== Check each id separately ====
-                for id in ids_chunk:
-                    params["accessions"] = id
-                    f = requests.get(url=url, params=params)
-                    if f.status_code != 400:
-                        mapping_chunk2 = pd.read_csv(f.url, sep="\t")
-                        mapping_chunk = mapping_chunk2 if mapping_chunk.empty \
-                            else pd.concat([mapping_chunk, mapping_chunk2])
-            # ==== All IDs were mapped ====
-            else:
-                mapping_chunk = pd.read_csv(f.url, sep="\t")
+        # ==== Remove contaminated, reverse mapped and known invalid IDs ====
+        ids = [x for x in ids if not x.startswith(("REV", "CON")) and x not in self.invalid_protein_ids]
+        # ==== Get mappings from local UniProt index ====
+        if self.uniprot_index is not None:
+            mapping = self.uniprot_index.get_mapping(ids)
+        # ==== Get mappings in chunks of uniprot_chunk_size IDs in parallel ====
+        else:
+            chunks = [ids[i:i + self.uniprot_chunk_size] for i in range(0, len(ids), self.uniprot_chunk_size)]
+            with ThreadPoolExecutor(max_workers=self.n_workers) as executor:
+                mapping_chunks = [x for x in executor.map(self.get_uniprot_chunk, chunks) if not x.empty]
             # ==== Combine to one mapping dataframe ====
-            mapping = mapping_chunk if mapping.empty else pd.concat([mapping, mapping_chunk])
+            mapping = pd.concat(mapping_chunks) if len(mapping_chunks) > 0 else pd.DataFrame()
         # ==== Changes inside final mapping dataframe ====
         if not mapping.empty:
             mapping.columns = [*mapping.columns[:-1], 'Protein ID']  # change name of last column
@@ -78,25 +179,89 @@ class MappingHandler:
             mapping['Protein ID'] = mapping['Protein ID'].apply(lambda x: x.split(","))
             mapping = mapping.explode('Protein ID')
             # ==== Save to global mapping ====
-            self.full_protein_mapping = pd.concat([self.full_protein_mapping, mapping])
+            self.add_to_table(mapping=mapping, in_type="protein")
+            if self.cache is not None and self.is_persisted(in_type="protein"):
+                self.cache.save(mapping=mapping, in_type="protein")
             # ==== Filter for organism if given ====
             if organism is not None:
                 mapping = mapping[mapping['Organism'] == organisms[organism]]
         return mapping
 
+    def get_uniprot_chunk(self, ids_chunk):
+        """
+        Get UniProt mapping for one chunk of protein IDs.
+
+        :param ids_chunk: List of protein IDs
+        :return: dataframe with mapping as returned by UniProt
+        """
+        url = 'https://rest.uniprot.org/uniprotkb/accessions'
+        params = {'format': 'tsv',
+                  'accessions': ",".join(ids_chunk),
+                  'fields': 'gene_names,gene_primary,reviewed,organism_name,accession'}
+        f = self.session.get(url=url, params=params)
+        # ==== If at least one ID doesn't exist ====
+        if f.status_code == 400:
+            # ==== Remember single invalid ID ====
+            if len(ids_chunk) == 1:
+                self.invalid_protein_ids.add(ids_chunk[0])
+                return pd.DataFrame()
+            # ==== Check both halves separately to isolate invalid IDs ====
+            half = len(ids_chunk) // 2
+            mapping_chunks = [x for x in [self.get_uniprot_chunk(ids_chunk[:half]),
+                                          self.get_uniprot_chunk(ids_chunk[half:])] if not x.empty]
+            return pd.concat(mapping_chunks) if len(mapping_chunks) > 0 else pd.DataFrame()
+        # ==== All IDs were mapped ====
+        return pd.read_csv(io.StringIO(f.text), sep="\t")
+
     # === Ortholog Mapping ====
     def get_ortholog_mapping(self, ids, organism, tar_organism):
         """
         Get ortholog mapping from source to target organism using gProfiler.
 
+        :param ids: Set of gene names
+        :param organism: Organism of the input ids
+        :param tar_organism: Organism to map to
+        :return: dataframe with mapped ortholog pairs
+        """
+        mapping = self.fetch_ortholog_mapping(ids=ids, organism=organism, tar_organism=tar_organism)
+        self.add_ortholog_mapping(mapping)
+        return mapping
+
+    def fetch_ortholog_mapping(self, ids, organism, tar_organism):
+        """
+        Get ortholog mapping from the local ortholog table or gProfiler without saving it. Safe to call from several
+        threads at once.
+
+        :param ids: Set of gene names
+        :param organism: Organism of the input ids
+        :param tar_organism: Organism to map to
+        :return: dataframe with mapped ortholog pairs
+        """
+        if self.ortholog_index is None:
+            return self.request_ortholog_mapping(ids=ids, organism=organism, tar_organism=tar_organism)
+        # ==== Get mappings from local ortholog table ====
+        mapping = self.ortholog_index.get_mapping(ids=ids, organism=organism, tar_organism=tar_organism)
+        # ==== Request gene names not in the local ortholog table ====
+        if self.ortholog_fallback:
+            found = set(mapping["source_symbol"])
+            remaining = [x for x in dict.fromkeys(ids) if x not in found]
+            if len(remaining) > 0:
+                mapping = pd.concat([mapping, self.request_ortholog_mapping(ids=remaining, organism=organism,
+                                                                            tar_organism=tar_organism)],
+                                    ignore_index=True)
+        return mapping
+
+    def request_ortholog_mapping(self, ids, organism, tar_organism):
+        """
+        Request ortholog mapping from gProfiler g:Orth.
+
         :param ids: Set of gene names
         :param organism: Organism of the input ids
         :param tar_organism: Organism to map to
         :return: dataframe with mapped ortholog pairs
         """
         organisms = {"human": "hsapiens", "mouse": "mmusculus", "rat": "rnorvegicus", "rabbit": "ocuniculus"}
-        gp = GProfiler(return_dataframe=True)
-        mapping = gp.orth(organism=organisms[organism], query=ids, target=organisms[tar_organism])
+        mapping = self.gprofiler.orth(organism=organisms[organism], query=list(ids), target=organisms[tar_organism])
         mapping = mapping.fillna('')
         # ==== Subset and rename columns ====
         mapping = mapping[['incoming', 'converted', 'ortholog_ensg', 'name', 'description']]
@@ -104,10 +269,37 @@ class MappingHandler:
         # ==== Save organism info ====
         mapping.insert(loc=1, column='source_organism', value=organism)
         mapping.insert(loc=5, column='target_organism', value=tar_organism)
-        # ==== Save to global mapping ====
-        self.full_ortholog_mapping = pd.concat([self.full_ortholog_mapping, mapping])
         return mapping
 
+    def add_ortholog_mapping(self, mapping):
+        # ==== Save to global mapping ====
+        self.add_to_table(mapping=mapping, in_type="orthologs")
+        if self.cache is not None and self.is_persisted(in_type="orthologs"):
+            self.cache.save(mapping=mapping, in_type="orthologs")
+
+    def get_ortholog_mappings(self, ids, organism, tar_organisms):
+        """
+        Add ortholog mappings of the same IDs for several target organisms. The targets are requested concurrently,
+        and all results are saved to the shared ortholog mapping.
+
+        :param ids: Set of gene names
+        :param organism: Organism of the input ids
+        :param tar_organisms: Organisms to map to
+        """
+        missing = {x: self.get_unresolved(ids=ids, in_type="orthologs", organism=organism, tar_organism=x)
+                   for x in dict.fromkeys(tar_organisms)}
+        missing = {x: ids_missing for x, ids_missing in missing.items() if len(ids_missing) > 0}
+        if len(missing) == 0:
+            return
+        # ==== Only the requests run in parallel, tables and cache are updated afterwards ====
+        with ThreadPoolExecutor(max_workers=len(missing)) as executor:
+            mappings = dict(zip(missing, executor.map(
+                lambda x: self.fetch_ortholog_mapping(ids=missing[x], organism=organism, tar_organism=x), missing)))
+        for tar_organism, mapping in mappings.items():
+            self.add_ortholog_mapping(mapping)
+            self.add_still_missing(ids=missing[tar_organism], in_type="orthologs", organism=organism,
+                                   tar_organism=tar_organism)
+
     # === Reduced Mapping ====
     def get_reduced_mapping(self, ids, organism, reduction_mode="ensembl"):
         if reduction_mode == "ensembl":
@@ -122,15 +314,16 @@ class MappingHandler:
             mapping = pd.DataFrame()
         if not mapping.empty:
             mapping["Mode"] = reduction_mode
-            self.full_reduced_gene_mapping = pd.concat([self.full_reduced_gene_mapping, mapping])
+            self.add_to_table(mapping=mapping, in_type="reduced_genes")
+            if self.cache is not None and self.is_persisted(in_type="reduced_genes", reduction_mode=reduction_mode):
+                self.cache.save(mapping=mapping, in_type="reduced_genes")
             return mapping
         else:
             return pd.DataFrame()
 
     def get_ensembl_reduction(self, ids, organism):  # organism required
         organisms = {"human": "hsapiens", "mouse": "mmusculus", "rat": "rnorvegicus", "rabbit": "ocuniculus"}
-        gp = GProfiler(return_dataframe=True)
-        gp_df = gp.convert(organism=organisms[organism], query=ids, target_namespace="ENSG")
+        gp_df = self.gprofiler.convert(organism=organisms[organism], query=list(ids), target_namespace="ENSG")
         if len(gp_df) == 0:
             return pd.DataFrame()
         else:
@@ -170,23 +363,15 @@ class MappingHandler:
                 return pd.DataFrame()
 
     def get_HGNC_reduction(self, ids):  # human organism required
-        mapping_dict = {}
-        for id in ids:
-            alias_df = get_HGNC_mapping(id, "alias_symbol")
-            symbol_df = get_HGNC_mapping(id, "symbol")
-            if alias_df is None and symbol_df is None:
-                # no information in HGNC for this id
-                mapping_dict[id] = None
-            else:
-                if alias_df is None:
-                    result_df = symbol_df
-                elif symbol_df is None:
-                    result_df = alias_df
-                else:
-                    result_df = pd.concat([alias_df, symbol_df])
-                mapping_dict[id] = list(result_df["Symbol"])
-
-        mapping = pd.DataFrame({"Gene Name": k, "Reduced Gene Name": v} for k, v in mapping_dict.items())
+        ids = list(dict.fromkeys(ids))
+        # ==== Symbols found by alias first, then by symbol ====
+        if self.hgnc_index is not None:
+            HGNC_df = get_HGNC_mappings_local(ids, index=self.hgnc_index, request_types=("alias_symbol", "symbol"))
+        else:
+            HGNC_df = get_HGNC_mappings(ids, request_types=("alias_symbol", "symbol"), n_workers=self.n_workers)
+        symbols = HGNC_df.groupby("Input", sort=False)["Symbol"].agg(list).to_dict()
+        # no information in HGNC for ids without entry
+        mapping = pd.DataFrame({"Gene Name": ids, "Reduced Gene Name": [symbols.get(id) for id in ids]})
         mapping["Organism"] = "human"
         return mapping
 
@@ -199,7 +384,7 @@ class MappingHandler:
         if len(gp_df) == 0:
             reduced_ids = [None for id in ids]
         else:
-            enrichment_ids = gp_df["intersections"].explode().to_list()
+            enrichment_ids = set(gp_df["intersections"].explode())
             reduced_ids = [id if id in enrichment_ids else None for id in ids]
         mapping = pd.DataFrame({"Gene Name": ids, "Reduced Gene Name": reduced_ids})
         mapping["Organism"] = organism
@@ -209,30 +394,33 @@ class MappingHandler:
         tax_ids = {"human": 9606, "mouse": 10090, "rat": 10116, "rabbit": 9986}
         inv_tax_ids = {tax_id: organism for organism, tax_id in tax_ids.items()}
 
-        mg = mygene.MyGeneInfo()
-        mg_output = mg.querymany(ids, scopes="symbol", fields="symbol,taxid", as_dataframe=True, returnall=True)
-        mg_df = mg_output["out"]
-        mg_df = mg_df[["symbol", "taxid"]]
+        # query batches of mygene_batch_size ids in parallel
+        ids = list(dict.fromkeys(ids))
+        batches = [ids[i:i + self.mygene_batch_size] for i in range(0, len(ids), self.mygene_batch_size)]
+        with ThreadPoolExecutor(max_workers=self.n_workers) as executor:
+            mg_df = pd.concat(list(executor.map(self.get_mygeneinfo_batch, batches)) + [pd.DataFrame()])
 
         # only get the species that we support
         mg_df = mg_df[mg_df["taxid"].isin(inv_tax_ids.keys())]
         mg_df = mg_df.replace({"taxid": inv_tax_ids})
 
-        mg_df["query"] = mg_df.index.values
-
-        # complete missing information
-        # TODO --> do it nicer
-        for tax_id, organism in inv_tax_ids.items():
-            for id in ids:
-                if not ((mg_df["query"] == id) & (mg_df["taxid"] == organism)).any():
-                    row = pd.DataFrame({"query": [id], "symbol": ["None"], "taxid": [organism]})
-                    mg_df = mg_df.append(row, ignore_index=True)
+        # complete missing information: left join of all (id, organism) pairs adds the missing ones without symbol
+        pairs = pd.MultiIndex.from_product([ids, list(tax_ids)], names=["query", "taxid"]).to_frame(index=False)
+        mg_df = pairs.merge(mg_df, on=["query", "taxid"], how="left")
 
         mapping = pd.DataFrame(
             {"Gene Name": mg_df["query"], "Reduced Gene Name": mg_df["symbol"], "Organism": mg_df["taxid"]})
         mapping = mapping.replace({np.nan: "None"})
         return mapping
 
+    @staticmethod
+    def get_mygeneinfo_batch(ids):
+        mg = mygene.MyGeneInfo()
+        mg_output = mg.querymany(ids, scopes="symbol", fields="symbol,taxid", as_dataframe=True, returnall=True)
+        mg_df = mg_output["out"].reindex(columns=["symbol", "taxid"])
+        mg_df["query"] = mg_df.index.values
+        return mg_df.reset_index(drop=True)
+
     def get_mapping(self, ids, in_type, organism=None, tar_organism=None, ignore_missing=False,
                     reduction_mode="ensembl"):
         """
@@ -249,51 +437,188 @@ class MappingHandler:
         # ===== get precalculated =====
         df, missing = self.get_preloaded(in_list=ids, in_type=in_type, organism=organism, tar_organism=tar_organism,
                                          reduction_mode=reduction_mode)
+        if len(missing) == 0 or ignore_missing:
+            return df
+        # ===== get cached and skip IDs known to have no mapping =====
+        missing = self.get_unresolved(ids=missing, in_type=in_type, organism=organism, tar_organism=tar_organism,
+                                      reduction_mode=reduction_mode)
         # ===== get missing =====
-        if len(missing) > 0 and not ignore_missing:
-            df2 = pd.DataFrame()
+        if len(missing) > 0:
             # ==== Filter protein IDs ====
             if in_type == "protein":
-                df2 = self.get_uniprot_mapping(ids=missing, organism=organism)
+                self.get_uniprot_mapping(ids=missing, organism=organism)
             # ==== Map orthologs ====
             if in_type == "orthologs":
-                df2 = self.get_ortholog_mapping(ids=missing, organism=organism, tar_organism=tar_organism)
+                self.get_ortholog_mapping(ids=missing, organism=organism, tar_organism=tar_organism)
             # ==== Reduce gene names ====
             if in_type == "reduced_genes":
-                df2 = self.get_reduced_mapping(ids=missing, organism=organism, reduction_mode=reduction_mode)
-            # ==== Concat if new found ====
-            if not df2.empty:
-                df = pd.concat([df, df2])
+                self.get_reduced_mapping(ids=missing, organism=organism, reduction_mode=reduction_mode)
+            # ==== Remember IDs that are still not mapped ====
+            self.add_still_missing(ids=missing, in_type=in_type, organism=organism, tar_organism=tar_organism,
+                                   reduction_mode=reduction_mode)
+        df, _ = self.get_preloaded(in_list=ids, in_type=in_type, organism=organism, tar_organism=tar_organism,
+                                   reduction_mode=reduction_mode)
         return df
 
+    def get_unresolved(self, ids, in_type, organism=None, tar_organism=None, reduction_mode="ensembl") -> list:
+        """
+        Load persisted mappings of IDs not in memory yet and return the IDs that still have to be fetched.
+
+        :param ids: Set of either protein IDs or gene names
+        :param in_type: Type of needed mapping [protein, orthologs, reduced_genes]
+        :param organism: Organism the input IDs (should) belong to
+        :param tar_organism: (Orthologs mode) Target organism to find the orthologs of
+        :param reduction_mode: Mode of how to reduce the gene names
+        :return: List of IDs without mapping and not known to be missing
+        """
+        _, missing = self.get_preloaded(in_list=ids, in_type=in_type, organism=organism, tar_organism=tar_organism,
+                                        reduction_mode=reduction_mode)
+        # ===== get cached =====
+        if len(missing) > 0 and self.cache is not None and self.is_persisted(in_type=in_type,
+                                                                             reduction_mode=reduction_mode):
+            self.load_cached(ids=missing, in_type=in_type, organism=organism, tar_organism=tar_organism,
+                             reduction_mode=reduction_mode)
+            _, missing = self.get_preloaded(in_list=missing, in_type=in_type, organism=organism,
+                                            tar_organism=tar_organism, reduction_mode=reduction_mode)
+        # ===== skip IDs known to have no mapping =====
+        if len(missing) > 0:
+            known_missing = self.get_known_missing(ids=missing, in_type=in_type, organism=organism,
+                                                   tar_organism=tar_organism, reduction_mode=reduction_mode)
+            missing = [x for x in missing if x not in known_missing]
+        return missing
+
+    def is_persisted(self, in_type: str, reduction_mode="ensembl") -> bool:
+        """
+        Check if fetched mappings and missing IDs of a type are saved to and loaded from the persistent cache.
+        Mappings from a local file are kept in memory only and cached mappings are not loaded for them, since the
+        cache does not record the source of its entries: a run on the web service would take local results (e.g.
+        FASTA entries with only the primary gene name, or IDs missing from a local proteome or ortholog table) for
+        fetched ones, and a run on a local file would return results and misses of the web service instead.
+        Enrichment reductions are not persisted either, as they are only valid for the gene list they were
+        computed on.
+
+        :param in_type: Type of mapping [protein, orthologs, reduced_genes]
+        :param reduction_mode: Mode of how to reduce the gene names
+        :return: True if the mappings come from a web service and do not depend on the other requested IDs
+        """
+        if in_type == "protein":
+            return self.uniprot_index is None
+        # ==== With ortholog_fallback, rows of the local table and of gProfiler are mixed ====
+        if in_type == "orthologs":
+            return self.ortholog_index is None
+        return reduction_mode != "enrichment"
+
+    # === Remember IDs without any mapping ====
+    @staticmethod
+    def get_missing_key(in_type: str, organism=None, tar_organism=None, reduction_mode="ensembl"):
+        # ==== UniProt mappings are fetched independent of the organism ====
+        if in_type == "protein":
+            return in_type, None, None, None
+        elif in_type == "orthologs":
+            return in_type, organism, tar_organism, None
+        else:
+            return in_type, organism, None, reduction_mode
+
+    def get_known_missing(self, ids, in_type: str, organism=None, tar_organism=None, reduction_mode="ensembl"):
+        """
+        Get IDs of given set that were already confirmed to have no mapping and are not expired.
+
+        :param ids: Set of either protein IDs or gene names
+        :param in_type: Type of needed mapping [protein, orthologs, reduced_genes]
+        :param organism: Organism the input IDs belong to
+        :param tar_organism: (Orthologs mode) Target organism to find the orthologs of
+        :param reduction_mode: Mode of how to reduce the gene names
+        :return: Set of known missing IDs
+        """
+        key = self.get_missing_key(in_type, organism, tar_organism, reduction_mode)
+        known = self.missing_ids.setdefault(key, dict())
+        # ==== Load persisted missing IDs only once per ID ====
+        if self.cache is not None and self.is_persisted(in_type=in_type, reduction_mode=reduction_mode):
+            checked = self.checked_missing_ids.setdefault(key, set())
+            unchecked = [x for x in ids if x not in checked]
+            known.update(self.cache.load_missing(ids=unchecked, key=key))
+            checked.update(unchecked)
+        min_time = time.time() - self.expiry_days * 86400 if self.expiry_days is not None else 0
+        return {x for x in ids if known.get(x, -1) >= min_time}
+
+    def add_known_missing(self, ids, in_type: str, organism=None, tar_organism=None, reduction_mode="ensembl"):
+        """
+        Remember IDs that were confirmed to have no mapping.
+
+        :param ids: Set of either protein IDs or gene names
+        :param in_type: Type of needed mapping [protein, orthologs, reduced_genes]
+        :param organism: Organism the input IDs belong to
+        :param tar_organism: (Orthologs mode) Target organism to find the orthologs of
+        :param reduction_mode: Mode of how to reduce the gene names
+        """
+        key = self.get_missing_key(in_type, organism, tar_organism, reduction_mode)
+        fetched = time.time()
+        self.missing_ids.setdefault(key, dict()).update({x: fetched for x in ids})
+        if self.cache is not None and self.is_persisted(in_type=in_type, reduction_mode=reduction_mode):
+            self.cache.save_missing(ids=ids, key=key, fetched=fetched)
+
+    def add_still_missing(self, ids, in_type: str, organism=None, tar_organism=None, reduction_mode="ensembl"):
+        """
+        Remember the fetched IDs that are still not mapped.
+
+        :param ids: Set of fetched protein IDs or gene names
+        :param in_type: Type of needed mapping [protein, orthologs, reduced_genes]
+        :param organism: Organism the input IDs belong to
+        :param tar_organism: (Orthologs mode) Target organism to find the orthologs of
+        :param reduction_mode: Mode of how to reduce the gene names
+        """
+        _, still_missing = self.get_preloaded(in_list=ids, in_type=in_type, organism=organism,
+                                              tar_organism=tar_organism, reduction_mode=reduction_mode)
+        self.add_known_missing(ids=still_missing, in_type=in_type, organism=organism, tar_organism=tar_organism,
+                               reduction_mode=reduction_mode)
+
     # === Check existing mapping entries and return missing ones ====
     def get_preloaded(self, in_list: list, in_type: str, organism=None, tar_organism=None, reduction_mode="ensembl"):
         # ==== Filter protein IDs ====
         if in_type == "protein":
             organisms = {"human": "Homo sapiens (Human)", "rat": "Rattus norvegicus (Rat)",
                          "mouse": "Mus musculus (Mouse)", "rabbit": "Oryctolagus cuniculus (Rabbit)"}
-            cur_mapping = self.full_protein_mapping[self.full_protein_mapping["Protein ID"].isin(in_list)]
+            cur_mapping = self.protein_table.lookup(in_list)
             if organism is not None:
                 cur_mapping = cur_mapping[cur_mapping['Organism'] == organisms[organism]]
-            return cur_mapping, list(set(in_list) - set(self.full_protein_mapping["Protein ID"]))
+            return cur_mapping, self.protein_table.missing(in_list)
         # ==== Map orthologs ====
         elif in_type == "orthologs":
-            cur_mapping = self.full_ortholog_mapping[self.full_ortholog_mapping["source_symbol"].isin(in_list)]
-            cur_mapping = cur_mapping[cur_mapping['source_organism'] == organism]
-            cur_mapping = cur_mapping[cur_mapping['target_organism'] == tar_organism]
-            return cur_mapping, list(set(in_list) - set(cur_mapping["source_symbol"]))
+            keys = [(x, organism, tar_organism) for x in in_list]
+            return self.ortholog_table.lookup(keys), [x[0] for x in self.ortholog_table.missing(keys)]
         # ==== Reduce gene names ====
         elif in_type == "reduced_genes":
-            cur_mapping = self.full_reduced_gene_mapping[self.full_reduced_gene_mapping["Gene Name"].isin(in_list)]
-            cur_mapping = cur_mapping[cur_mapping['Organism'] == organism]
-            cur_mapping = cur_mapping[cur_mapping['Mode'] == reduction_mode]
-            return cur_mapping, list(set(in_list) - set(cur_mapping["Gene Name"]))
+            keys = [(x, organism, reduction_mode) for x in in_list]
+            return self.reduced_gene_table.lookup(keys), [x[0] for x in self.reduced_gene_table.missing(keys)]
         else:
             return None
 
-    # === Save new mappings to files ====
-    # def save_mappings(self, mapping_dir):
-    #     mapping_dir = join(here, mapping_dir)
-    #     self.full_protein_mapping.to_csv(mapping_dir + "protein_to_genenames.csv", index=False)
-    #     self.full_ortholog_mapping.to_csv(mapping_dir + "genenames_to_orthologs.csv", index=False)
-    #     self.full_reduced_gene_mapping.to_csv(mapping_dir + "genenames_to_reduced_genenames.csv", index=False)
+    # === Load persisted mappings into memory ====
+    def load_cached(self, ids, in_type: str, organism=None, tar_organism=None, reduction_mode="ensembl"):
+        """
+        Load mappings of given IDs from the persistent cache into the in-memory mappings.
+
+        :param ids: Set of either protein IDs or gene names
+        :param in_type: Type of needed mapping [protein, orthologs, reduced_genes]
+        :param organism: Organism the input IDs belong to
+        :param tar_organism: (Orthologs mode) Target organism to find the orthologs of
+        :param reduction_mode: Mode of how to reduce the gene names
+        """
+        cached = self.cache.load(ids=ids, in_type=in_type, organism=organism, tar_organism=tar_organism,
+                                 reduction_mode=reduction_mode)
+        if not cached.empty:
+            self.add_to_table(mapping=cached, in_type=in_type)
+
+    def add_to_table(self, mapping: pd.DataFrame, in_type: str):
+        """
+        Add mapping rows to the in-memory mapping of their type and drop transformed cells containing their IDs.
+
+        :param mapping: Dataframe with mapping rows
+        :param in_type: Type of the mapping [protein, orthologs, reduced_genes]
+        """
+        tables = {"protein": (self.protein_table, "Protein ID"), "orthologs": (self.ortholog_table, "source_symbol"),
+                  "reduced_genes": (self.reduced_gene_table, "Gene Name")}
+        table, id_column = tables[in_type]
+        table.append(mapping)
+        if id_column in mapping.columns:
+            self.cell_cache.discard(in_type=in_type, ids=mapping[id_column].dropna())
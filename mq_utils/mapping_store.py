@@ -0,0 +1,150 @@
+#!/usr/bin/python3
+
+import json
+import os
+import numpy as np
+import pandas as pd
+
+# ==== Kind of each stored value ====
+KIND_NONE, KIND_STR, KIND_LIST, KIND_NAN = 0, 1, 2, 3
+# ==== Separator of list items and key parts, not part of any ID ====
+SEPARATOR = "\x1f"
+
+
+def _encode_key(key) -> bytes:
+    parts = key if isinstance(key, tuple) else (key,)
+    # ==== None is stored as \x01, since trailing null bytes are stripped from numpy byte strings ====
+    return SEPARATOR.join("\x01" if x is None else x if isinstance(x, str) else "\x02" + repr(x)
+                          for x in parts).encode()
+
+
+def _encode_value(value):
+    if value is None:
+        return KIND_NONE, b""
+    if isinstance(value, str):
+        return KIND_STR, value.encode()
+    if isinstance(value, list):
+        return KIND_LIST, SEPARATOR.join(value).encode()
+    if isinstance(value, float) and np.isnan(value):
+        return KIND_NAN, b""
+    raise TypeError(f"Mapping value of type {type(value).__name__} can not be stored")
+
+
+def _decode_value(kind: int, value: bytes):
+    if kind == KIND_STR:
+        return value.decode()
+    if kind == KIND_LIST:
+        return value.decode().split(SEPARATOR) if len(value) > 0 else []
+    return np.nan if kind == KIND_NAN else None
+
+
+def export_mapping_table(table, directory: str) -> "SharedMappingTable":
+    """
+    Write the rows of a mapping table as memory-mappable arrays. Rows are grouped by key, and the keys are sorted, so
+    lookups are binary searches on the mapped key array.
+
+    :param table: MappingTable to export
+    :param directory: Directory to write the arrays to
+    :return: Read-only table attached to the written arrays
+    """
+    os.makedirs(directory, exist_ok=True)
+    keys = sorted(table.index, key=_encode_key)
+    key_rows = [table.rows(x) for x in keys]
+    rows = [row for x in key_rows for row in x]
+    np.save(os.path.join(directory, "keys.npy"), np.array([_encode_key(x) for x in keys], dtype=bytes))
+    np.save(os.path.join(directory, "key_starts.npy"), np.cumsum([0] + [len(x) for x in key_rows], dtype=np.int64))
+    for i in range(len(table.columns)):
+        kinds, values = zip(*[_encode_value(row[i]) for row in rows]) if len(rows) > 0 else ((), ())
+        np.save(os.path.join(directory, f"column{i}_kinds.npy"), np.array(kinds, dtype=np.int8))
+        np.save(os.path.join(directory, f"column{i}_offsets.npy"),
+                np.cumsum([0] + [len(x) for x in values], dtype=np.int64))
+        np.save(os.path.join(directory, f"column{i}_data.npy"), np.frombuffer(b"".join(values), dtype=np.uint8))
+    with open(os.path.join(directory, "table.json"), "w") as f:
+        json.dump({"columns": table.columns, "keys": table.keys}, f)
+    return SharedMappingTable(directory)
+
+
+class SharedMappingTable:
+    """
+    Read-only mapping table on memory-mapped arrays written by export_mapping_table. All processes attached to the
+    same directory share one copy of the data in the page cache, and only looked up rows are decoded. Offers the
+    lookup interface of MappingTable.
+    """
+
+    def __init__(self, directory: str):
+        """
+        :param directory: Directory with the arrays of an exported mapping table
+        """
+        self.directory = directory
+        with open(os.path.join(directory, "table.json")) as f:
+            info = json.load(f)
+        self.columns = info["columns"]
+        self.keys = info["keys"]
+        self._attach()
+
+    def _attach(self):
+        def load(name):
+            return np.load(os.path.join(self.directory, name + ".npy"), mmap_mode="r")
+        self.key_values = load("keys")
+        self.key_starts = load("key_starts")
+        self.kinds = [load(f"column{i}_kinds") for i in range(len(self.columns))]
+        self.offsets = [load(f"column{i}_offsets") for i in range(len(self.columns))]
+        self.data = [load(f"column{i}_data") for i in range(len(self.columns))]
+
+    def __getstate__(self):
+        # ==== Other processes attach to the arrays instead of copying them ====
+        return {"directory": self.directory, "columns": self.columns, "keys": self.keys}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._attach()
+
+    def _find(self, keys) -> list:
+        keys = list(dict.fromkeys(keys))
+        if len(self.key_values) == 0 or len(keys) == 0:
+            return [(x, -1) for x in keys]
+        encoded = np.array([_encode_key(x) for x in keys], dtype=bytes)
+        positions = np.minimum(np.searchsorted(self.key_values, encoded), len(self.key_values) - 1)
+        found = self.key_values[positions] == encoded
+        return [(x, position if is_found else -1) for x, position, is_found in zip(keys, positions, found)]
+
+    def _rows(self, rows) -> pd.DataFrame:
+        rows = np.asarray(rows, dtype=np.int64)
+        values = dict()
+        for i, column in enumerate(self.columns):
+            # ==== Only the selected rows are read from the mapped arrays ====
+            data = memoryview(self.data[i])
+            values[column] = pd.Series([_decode_value(kind, data[start:end].tobytes()) for kind, start, end in
+                                        zip(self.kinds[i][rows], self.offsets[i][rows], self.offsets[i][rows + 1])],
+                                       dtype=object)
+        return pd.DataFrame(values)
+
+    @property
+    def frame(self) -> pd.DataFrame:
+        """
+        All rows of the table as one dataframe.
+        """
+        return self._rows(range(len(self.kinds[0]) if len(self.kinds) > 0 else 0))
+
+    def append(self, mapping: pd.DataFrame):
+        raise TypeError("Shared mapping tables are read-only")
+
+    def lookup(self, keys) -> pd.DataFrame:
+        """
+        Get all rows of the given keys.
+
+        :param keys: Keys to look up, single values for one key column, tuples for several
+        :return: Dataframe with the rows of all found keys
+        """
+        rows = [row for _, position in self._find(keys) if position >= 0
+                for row in range(self.key_starts[position], self.key_starts[position + 1])]
+        return self._rows(rows)
+
+    def missing(self, keys) -> list:
+        """
+        Get keys without any row in the table.
+
+        :param keys: Keys to check
+        :return: List of missing keys
+        """
+        return [key for key, position in self._find(keys) if position < 0]
@@ -0,0 +1,136 @@
+#!/usr/bin/python3
+
+from array import array
+import numpy as np
+import pandas as pd
+
+
+class MappingTable:
+    """
+    Mapping table stored column-wise with a hash index on its key columns. Columns with few distinct values are
+    stored as integer codes into a list of their categories, and the index maps each key to the position of its row
+    (or a list of positions, if a key has several rows), so a row costs a few pointers and codes instead of a tuple.
+    The index is updated incrementally on every append, so looking up a set of keys costs about the number of keys
+    instead of a scan over the whole table.
+    """
+
+    def __init__(self, columns: list, keys: list, categories: list = ()):
+        """
+        :param columns: Columns of the mapping table
+        :param keys: Columns the rows are indexed by
+        :param categories: Columns with few distinct values, stored as codes and as categorical in the frame
+        """
+        self.columns = columns
+        self.keys = keys
+        self.categories = list(categories)
+        self.index = dict()
+        # ==== Number of appends that added rows, to tell if exported copies are outdated ====
+        self.version = 0
+        # ==== Values per column, codes for categorical columns ====
+        self._values = [array("i") if x in self.categories else list() for x in columns]
+        # ==== Category values per categorical column (None otherwise) and their codes ====
+        self._category_values = [list() if x in self.categories else None for x in columns]
+        self._category_codes = [dict() if x in self.categories else None for x in columns]
+        self._frame = None
+
+    def __len__(self):
+        return len(self._values[0])
+
+    def _value(self, column: int, position: int):
+        value = self._values[column][position]
+        return value if self._category_values[column] is None else self._category_values[column][value]
+
+    def _positions(self, key) -> tuple:
+        positions = self.index.get(key, ())
+        return (positions,) if isinstance(positions, int) else positions
+
+    def rows(self, key) -> list:
+        """
+        Get the rows of one key as tuples.
+
+        :param key: Key to look up, single value for one key column, tuple for several
+        :return: List of row tuples in column order
+        """
+        return [tuple(self._value(i, x) for i in range(len(self.columns))) for x in self._positions(key)]
+
+    @property
+    def frame(self) -> pd.DataFrame:
+        """
+        All rows of the table as one dataframe.
+        """
+        if self._frame is None:
+            self._frame = self._get_frame().astype({x: "category" for x in self.categories})
+        return self._frame
+
+    def append(self, mapping: pd.DataFrame):
+        """
+        Add new mapping rows to the table and its index. Rows already in the table are skipped.
+
+        :param mapping: Dataframe with (at least) the columns of the table
+        """
+        if mapping.empty:
+            return
+        rows = mapping.reindex(columns=self.columns)
+        key_positions = [self.columns.index(x) for x in self.keys]
+        size = len(self)
+        for row in rows.itertuples(index=False, name=None):
+            # ==== Missing values are stored as None, as NaN values are not equal to each other ====
+            row = tuple(None if isinstance(x, float) and np.isnan(x) else x for x in row)
+            key = row[key_positions[0]] if len(key_positions) == 1 else tuple(row[x] for x in key_positions)
+            positions = self.index.get(key)
+            if positions is not None and row in self.rows(key):
+                continue
+            position = len(self)
+            for i, value in enumerate(row):
+                codes = self._category_codes[i]
+                if codes is not None:
+                    if value not in codes:
+                        codes[value] = len(codes)
+                        self._category_values[i].append(value)
+                    value = codes[value]
+                self._values[i].append(value)
+            if positions is None:
+                self.index[key] = position
+            elif isinstance(positions, int):
+                self.index[key] = [positions, position]
+            else:
+                positions.append(position)
+        if len(self) > size:
+            self.version += 1
+            self._frame = None
+
+    def _get_frame(self, positions=None) -> pd.DataFrame:
+        values = dict()
+        for column, column_values, categories in zip(self.columns, self._values, self._category_values):
+            if categories is not None:
+                # ==== Decode all selected codes of a categorical column at once ====
+                category_array = np.empty(len(categories), dtype=object)
+                for i, category in enumerate(categories):
+                    category_array[i] = category
+                codes = np.frombuffer(column_values, dtype=np.intc)
+                column_values = category_array[codes if positions is None else codes[positions]]
+            else:
+                selected = column_values if positions is None else [column_values[x] for x in positions]
+                column_values = np.fromiter(selected, dtype=object, count=len(selected))
+            # ==== Keep values as stored (None, lists) instead of letting pandas infer dtypes ====
+            values[column] = pd.Series(column_values, dtype=object)
+        return pd.DataFrame(values)
+
+    def lookup(self, keys) -> pd.DataFrame:
+        """
+        Get all rows of the given keys.
+
+        :param keys: Keys to look up, single values for one key column, tuples for several
+        :return: Dataframe with the rows of all found keys
+        """
+        return self._get_frame(np.array([x for key in dict.fromkeys(keys) for x in self._positions(key)],
+                                        dtype=np.int64))
+
+    def missing(self, keys) -> list:
+        """
+        Get keys without any row in the table.
+
+        :param keys: Keys to check
+        :return: List of missing keys
+        """
+        return [key for key in dict.fromkeys(keys) if key not in self.index]
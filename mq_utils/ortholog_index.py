@@ -0,0 +1,107 @@
+#!/usr/bin/python3
+
+import os
+import sqlite3
+import pandas as pd
+from .index_utils import get_index_file
+
+# ==== Columns of the ortholog mapping, source and target columns are required in the ortholog table ====
+COLUMNS = ['source_symbol', 'source_organism', 'ensg', 'ortholog_ensg', 'target_symbol', 'target_organism',
+           'description']
+REQUIRED_COLUMNS = ['source_symbol', 'source_organism', 'target_symbol', 'target_organism']
+# ==== gProfiler organism names used in exports, other names are kept ====
+ORGANISM_NAMES = {"hsapiens": "human", "mmusculus": "mouse", "rnorvegicus": "rat", "ocuniculus": "rabbit"}
+# ==== Max number of bound parameters per SQLite statement ====
+CHUNK_SIZE = 900
+
+
+def read_ortholog_table(ortholog_file: str) -> pd.DataFrame:
+    """
+    Read a tab-separated ortholog table with the columns source_symbol, source_organism, target_symbol and
+    target_organism, and optionally ensg, ortholog_ensg and description.
+
+    :param ortholog_file: Ortholog table, optionally gzipped
+    :return: Dataframe with the columns of the ortholog mapping
+    """
+    mapping = pd.read_csv(ortholog_file, sep="\t", dtype=str, keep_default_na=False)
+    missing = [x for x in REQUIRED_COLUMNS if x not in mapping.columns]
+    if len(missing) > 0:
+        raise ValueError(f"Ortholog table {ortholog_file} misses the columns {', '.join(missing)}")
+    mapping = mapping.reindex(columns=COLUMNS, fill_value="")
+    for column in ["source_organism", "target_organism"]:
+        mapping[column] = mapping[column].replace(ORGANISM_NAMES)
+    return mapping
+
+
+def build_ortholog_index(source: str, index_file: str):
+    """
+    Build an indexed SQLite file with the orthologs of each (source_organism, source_symbol, target_organism).
+
+    :param source: Ortholog table, optionally gzipped
+    :param index_file: Path of the index file to create
+    """
+    mapping = read_ortholog_table(source).drop_duplicates()
+    temp_file = index_file + ".tmp"
+    if os.path.exists(temp_file):
+        os.remove(temp_file)
+    connection = sqlite3.connect(temp_file)
+    with connection:
+        columns = ", ".join(f'"{x}" TEXT' for x in COLUMNS)
+        connection.execute(f'CREATE TABLE orthologs ({columns})')
+        columns = ", ".join(f'"{x}"' for x in COLUMNS)
+        connection.executemany(f'INSERT INTO orthologs ({columns}) VALUES ({", ".join("?" * len(COLUMNS))})',
+                               mapping.itertuples(index=False, name=None))
+        connection.execute('CREATE INDEX orthologs_key ON orthologs '
+                           '("source_organism", "source_symbol", "target_organism")')
+    connection.close()
+    os.replace(temp_file, index_file)
+
+
+class OrthologIndex:
+    """
+    Local ortholog table used instead of gProfiler g:Orth.
+    """
+
+    def __init__(self, ortholog_file: str, mmap: bool = True, index_dir: str = None):
+        """
+        :param ortholog_file: Tab-separated ortholog table. The index is built on first use and rebuilt whenever the
+                              table is newer than the index.
+        :param mmap: Set True to memory-map the index instead of reading it through SQLite's page cache
+        :param index_dir: Directory to build the index in. If None, it is built next to the table.
+        """
+        self.ortholog_file = ortholog_file
+        self.index_file = get_index_file(source=ortholog_file, suffix=".index.db", index_dir=index_dir)
+        self.mmap = mmap
+        if not os.path.exists(self.index_file) or \
+                os.path.getmtime(self.index_file) < os.path.getmtime(self.ortholog_file):
+            build_ortholog_index(source=self.ortholog_file, index_file=self.index_file)
+        self._connection = None
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(f"file:{self.index_file}?mode=ro", uri=True,
+                                               check_same_thread=False)
+            if self.mmap:
+                self._connection.execute("PRAGMA mmap_size = 4294967296")
+        return self._connection
+
+    def get_mapping(self, ids, organism: str, tar_organism: str) -> pd.DataFrame:
+        """
+        Get orthologs of given gene names.
+
+        :param ids: Set of gene names
+        :param organism: Organism of the input ids
+        :param tar_organism: Organism to map to
+        :return: Dataframe with the columns of the ortholog mapping for all found gene names
+        """
+        ids = list(set(ids))
+        columns = ", ".join(f'"{x}"' for x in COLUMNS)
+        rows = list()
+        for i in range(0, len(ids), CHUNK_SIZE):
+            ids_chunk = ids[i:i + CHUNK_SIZE]
+            rows += self.connection.execute(f'SELECT {columns} FROM orthologs '
+                                            f'WHERE "source_organism" = ? AND "target_organism" = ? '
+                                            f'AND "source_symbol" IN ({",".join("?" * len(ids_chunk))})',
+                                            [organism, tar_organism] + ids_chunk).fetchall()
+        return pd.DataFrame(rows, columns=COLUMNS, dtype=object)
@@ -0,0 +1,42 @@
+#!/usr/bin/python3
+
+import multiprocessing
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+# ==== Read-only objects shared with all partitions of a worker process ====
+_shared = dict()
+
+
+def _init_worker(shared: dict):
+    _shared.update(shared)
+
+
+def _run_partition(function, part: pd.DataFrame, kwargs: dict):
+    return function(part, **_shared, **kwargs)
+
+
+def map_partitions(function, data: pd.DataFrame, n_jobs: int, shared: dict, **kwargs) -> list:
+    """
+    Apply function to contiguous row partitions of data in a pool of n_jobs processes.
+
+    Shared objects are handed to each worker once when it starts. Objects with an export_store method, like the
+    MappingHandler with the prefetched mappings, are exported to memory-mapped arrays first, so all workers attach
+    to one copy of the mappings. The export is kept by the object and reused by later calls until its mappings change.
+
+    :param function: Module level function called as function(part, **shared, **kwargs)
+    :param data: Dataframe to partition by rows
+    :param n_jobs: Number of worker processes
+    :param shared: Read-only objects passed to every call
+    :param kwargs: Further arguments passed to every call
+    :return: List of results per partition in row order
+    """
+    n_parts = max(1, min(n_jobs, len(data)))
+    bounds = np.linspace(0, len(data), n_parts + 1).astype(int)
+    parts = [data.iloc[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+    context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+    shared = {name: x.export_store() if hasattr(x, "export_store") else x for name, x in shared.items()}
+    with ProcessPoolExecutor(max_workers=n_parts, mp_context=context, initializer=_init_worker,
+                             initargs=(shared,)) as executor:
+        return list(executor.map(_run_partition, [function] * n_parts, parts, [kwargs] * n_parts))
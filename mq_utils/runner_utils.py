@@ -36,7 +36,8 @@ def save_parameters(script_desc: str, arguments):
                                    required=True, help='Specify organism the ids should match to.')
     if 'tor_req' in arguments:
         required_args.add_argument('-tor', '--tar_organism', choices=["human", "mouse", "rat", "rabbit"], type=str,
-                                   required=True, help='Specify organism from which orthologs should be mapped.')
+                                   nargs='+', required=True,
+                                   help='Specify organism(s) from which orthologs should be mapped.')
     if 'pc_req' in arguments:
         required_args.add_argument('-pc', '--protein_column', type=str,
                                    help='Name of column with protein IDs.', required=True)
@@ -51,6 +52,9 @@ def save_parameters(script_desc: str, arguments):
         required_args.add_argument( '-m', '--mode',
                                     choices=[ 'ensembl', 'mygeneinfo', 'HGNC', 'enrichment'],
                                     type=str, required=True, help='Mode of reducing. See below for more infos.' )
+    if 'st_req' in arguments:
+        required_args.add_argument('-st', '--stages', type=str, required=True,
+                                   help='JSON file with the list of stages to run. See below for more infos.')
     if 'i' in arguments:
         required_args.add_argument('-i', '--in_type', choices=['protein', 'gene'], required=True,
                                    help='Define what type should be the source.')
@@ -92,16 +96,75 @@ def save_parameters(script_desc: str, arguments):
     if 'rv' in arguments:
         optional_args.add_argument('-rv', '--rev_con', action='store_true', default=False,
                                    help='Set flag if decoy and contaminants IDs (REV__, CON__) should be kept.')
+    if 'md' in arguments:
+        optional_args.add_argument('-md', '--mapping_dir', type=str, default=None,
+                                   help='Directory to persist fetched mappings for later runs. [Default=None]')
+        optional_args.add_argument('-ex', '--expiry_days', type=float, default=None,
+                                   help='Days after which persisted mappings are fetched again. '
+                                        'If None, they never expire. [Default=None]')
+    if 'uf' in arguments:
+        optional_args.add_argument('-uf', '--uniprot_file', type=str, default=None,
+                                   help='Local UniProt FASTA or TSV export to use instead of the UniProt API. '
+                                        '[Default=None]')
+    if 'hf' in arguments:
+        optional_args.add_argument('-hf', '--hgnc_file', type=str, default=None,
+                                   help='Local HGNC complete set file to use instead of the HGNC API. [Default=None]')
+    if 'of' in arguments:
+        optional_args.add_argument('-of', '--ortholog_file', type=str, default=None,
+                                   help='Local ortholog table (TSV) to use instead of gProfiler. [Default=None]')
+        optional_args.add_argument('-ofb', '--ortholog_fallback', action='store_true', default=False,
+                                   help='Set flag if gene names missing in the local ortholog table should be '
+                                        'requested from gProfiler.')
+    if 'cs' in arguments:
+        optional_args.add_argument('-cs', '--chunk_size', type=int, default=None,
+                                   help='Process the data file in chunks of this many rows and append the results '
+                                        'to the output files. If None, the whole file is loaded. [Default=None]')
+    if 'nj' in arguments:
+        optional_args.add_argument('-nj', '--n_jobs', type=int, default=1,
+                                   help='Number of processes to transform the rows and parse fasta files in. '
+                                        '[Default=1]')
     if 'o' in arguments:
         optional_args.add_argument('-o', '--out_dir', type=str, default='./', help='Output directory. [Default=./]')
     optional_args.add_argument("-h", "--help", action="help", help="show this help message and exit")
     args = parser.parse_args()
     if 'd' in arguments:
-        args.data = pd.read_table(args.data).fillna("")
-        args.file_name = Path(args.single_file).stem
+        args.file_name = Path(args.data).stem
+        args.data_file = args.data
+        # ==== Streaming mode reads the data file lazily in chunks ====
+        if getattr(args, 'chunk_size', None) is not None:
+            args.data = pd.read_table(args.data, chunksize=args.chunk_size)
+        else:
+            args.data = pd.read_table(args.data).fillna("")
     return args
 
 
+def write_results(data, process, files: dict):
+    """
+    Process data and write the resulting dataframe and logs. If data is an iterator of chunks, as read in streaming
+    mode, each chunk is processed on its own and its results are appended to the files, so only one chunk is held in
+    memory at a time.
+
+    :param data: Dataframe or iterator of dataframe chunks
+    :param process: Function returning the processed dataframe and a dictionary of logs for a dataframe
+    :param files: Output file per result, key "Data" for the processed dataframe and the log names for the logs
+    """
+    chunks = [data] if isinstance(data, pd.DataFrame) else (chunk.fillna("") for chunk in data)
+    written = set()
+    for chunk in chunks:
+        res, log = process(chunk)
+        for name, frame in {"Data": res, **log}.items():
+            # ==== Logs without any entry in this chunk have no columns yet ====
+            if len(frame.columns) == 0:
+                continue
+            frame.to_csv(files[name], mode="a" if name in written else "w", header=name not in written,
+                         index=False, quoting=csv.QUOTE_NONNUMERIC, sep=" ")
+            written.add(name)
+    # ==== Results without any entry in all chunks ====
+    for name in files:
+        if name not in written:
+            pd.DataFrame().to_csv(files[name], header=True, index=False, quoting=csv.QUOTE_NONNUMERIC, sep=" ")
+
+
 def _get_epilog(script_name):
     epilog = ""
     if script_name == 'remap_genenames.py':
@@ -119,6 +182,16 @@ def _get_epilog(script_name):
         epilog += "  mygeneinfo\t\tUse mygeneinfo database to reduce gene names to those having an entry in mygeneinfo.\n"
         epilog += "  HGNC\t\tUse HGNC database to reduce gene names to those having an entry in HGNC (only for human).\n"
         epilog += "  enrichment\tUse gProfiler to reduce gene names to those having a functional annotation.\n"
+    if script_name == "run_pipeline.py":
+        epilog += "\n----------------------------------------------------------------------------\n"
+        epilog += "\nstages file\n"
+        epilog += "  JSON list of stages run in the given order. Each stage names the step under \"stage\"\n"
+        epilog += "  (filter, remap, reduce, orthologs) and sets the arguments of its function, e.g.\n"
+        epilog += "  [{\"stage\": \"filter\", \"protein_column\": \"Protein IDs\", \"organism\": \"human\"},\n"
+        epilog += "   {\"stage\": \"remap\", \"mode\": \"uniprot_primary\", \"protein_column\": \"Protein IDs\",\n"
+        epilog += "    \"gene_column\": \"Gene names\", \"organism\": \"human\"},\n"
+        epilog += "   {\"stage\": \"orthologs\", \"gene_column\": \"Gene names\", \"organism\": \"human\",\n"
+        epilog += "    \"tar_organism\": \"mouse\"}]\n"
     epilog += "\n############################################################################\n"
     return epilog
 
@@ -0,0 +1,34 @@
+#!/usr/bin/python3
+
+import numpy as np
+import pandas as pd
+
+
+def split_ids(column: pd.Series, name: str = "ID") -> pd.DataFrame:
+    """
+    Split a column of semicolon separated IDs into one row per ID. The IDs are stored as categorical, so every
+    distinct ID is kept once and duplicates, merges and set operations work on integer codes.
+
+    :param column: Series with semicolon separated IDs per cell
+    :param name: Column name of the split IDs
+    :return: Dataframe with columns 'row' (position of the original cell) and name (categorical)
+    """
+    lists = column.astype(str).str.split(";")
+    return pd.DataFrame({"row": np.repeat(np.arange(len(column), dtype=np.int32), lists.str.len().to_numpy()),
+                         name: pd.Categorical(lists.explode().to_numpy())})
+
+
+def join_ids(split: pd.DataFrame, column: pd.Series, name: str = "ID") -> pd.Series:
+    """
+    Combine split IDs back into one semicolon separated string per original cell, keeping their first occurrence.
+
+    :param split: Dataframe with columns 'row' and name as returned by split_ids
+    :param column: Original column the rows refer to
+    :param name: Column name of the split IDs
+    :return: Series aligned to column with the joined IDs, empty string for rows without IDs
+    """
+    split = split.drop_duplicates(subset=["row", name])
+    # ==== Join as strings, otherwise single-ID rows are cast back to the categorical of the split IDs ====
+    joined = split[name].astype(object).groupby(split["row"], sort=True).agg(";".join)
+    joined = joined.reindex(np.arange(len(column)), fill_value="")
+    return pd.Series(joined.to_numpy(), index=column.index, dtype=object)
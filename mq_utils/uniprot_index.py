@@ -0,0 +1,131 @@
+#!/usr/bin/python3
+
+import gzip
+import os
+import re
+import sqlite3
+import pandas as pd
+from .index_utils import get_index_file
+
+# ==== UniProt organism names of supported taxonomy IDs, other organisms keep the name of the FASTA header ====
+ORGANISM_NAMES = {"9606": "Homo sapiens (Human)", "10090": "Mus musculus (Mouse)",
+                  "10116": "Rattus norvegicus (Rat)", "9986": "Oryctolagus cuniculus (Rabbit)"}
+# ==== Columns in the order of the UniProt REST API response ====
+COLUMNS = ['Gene Names', 'Gene Names (primary)', 'Reviewed', 'Organism', 'Entry']
+HEADER = re.compile(r">(\w+)\|([^|]+)\|")
+ORGANISM = re.compile(r"\sOS=(.*?)\s(?:OX=|GN=|PE=|SV=|$)")
+TAXONOMY = re.compile(r"\sOX=(\d+)")
+GENE = re.compile(r"\sGN=(\S+)")
+# ==== Max number of bound parameters per SQLite statement ====
+CHUNK_SIZE = 900
+
+
+def _open(file: str):
+    return gzip.open(file, "rt") if file.endswith(".gz") else open(file)
+
+
+def read_fasta(fasta: str) -> pd.DataFrame:
+    """
+    Read UniProt mapping information from the headers of a UniProt FASTA file.
+    FASTA headers only contain the primary gene name, which is used for both gene name columns.
+
+    :param fasta: UniProt FASTA file, optionally gzipped
+    :return: Dataframe with the columns of the UniProt REST API response
+    """
+    rows = list()
+    with _open(fasta) as file:
+        for line in file:
+            if not line.startswith(">"):
+                continue
+            header = HEADER.match(line)
+            if header is None:
+                continue
+            taxonomy = TAXONOMY.search(line)
+            organism = ORGANISM.search(line)
+            organism = ORGANISM_NAMES.get(taxonomy.group(1) if taxonomy else None,
+                                          organism.group(1) if organism else None)
+            gene = GENE.search(line)
+            gene = gene.group(1) if gene else None
+            rows.append([gene, gene, "reviewed" if header.group(1) == "sp" else "unreviewed", organism,
+                         header.group(2)])
+    return pd.DataFrame(rows, columns=COLUMNS)
+
+
+def read_tsv(tsv: str) -> pd.DataFrame:
+    """
+    Read UniProt mapping information from a tab-separated UniProt export with the columns 'Entry', 'Gene Names',
+    'Gene Names (primary)', 'Reviewed' and 'Organism'.
+
+    :param tsv: UniProt TSV export, optionally gzipped
+    :return: Dataframe with the columns of the UniProt REST API response
+    """
+    return pd.read_csv(tsv, sep="\t", usecols=COLUMNS, dtype=str)[COLUMNS]
+
+
+def build_uniprot_index(source: str, index_file: str):
+    """
+    Build an indexed SQLite file with the mapping of each accession from a UniProt FASTA or TSV export.
+
+    :param source: UniProt FASTA or TSV export, optionally gzipped
+    :param index_file: Path of the index file to create
+    """
+    name = source[:-3] if source.endswith(".gz") else source
+    mapping = read_tsv(source) if name.endswith((".tsv", ".tab", ".txt")) else read_fasta(source)
+    mapping = mapping.drop_duplicates(subset="Entry")
+    mapping = mapping.astype(object).where(mapping.notna(), None)
+    temp_file = index_file + ".tmp"
+    if os.path.exists(temp_file):
+        os.remove(temp_file)
+    connection = sqlite3.connect(temp_file)
+    with connection:
+        columns = ", ".join(f'"{x}" TEXT' for x in COLUMNS[:-1])
+        connection.execute(f'CREATE TABLE uniprot ("Entry" TEXT PRIMARY KEY, {columns}) WITHOUT ROWID')
+        columns = ", ".join(f'"{x}"' for x in COLUMNS)
+        connection.executemany(f'INSERT INTO uniprot ({columns}) VALUES (?, ?, ?, ?, ?)',
+                               mapping.itertuples(index=False, name=None))
+    connection.close()
+    os.replace(temp_file, index_file)
+
+
+class UniProtIndex:
+    """
+    Local, memory-mapped UniProt index used instead of the UniProt REST API.
+    """
+
+    def __init__(self, uniprot_file: str, index_dir: str = None):
+        """
+        :param uniprot_file: UniProt FASTA or TSV export. The index is built on first use and rebuilt whenever the
+                             export is newer than the index.
+        :param index_dir: Directory to build the index in. If None, it is built next to the export.
+        """
+        self.uniprot_file = uniprot_file
+        self.index_file = get_index_file(source=uniprot_file, suffix=".index.db", index_dir=index_dir)
+        if not os.path.exists(self.index_file) or \
+                os.path.getmtime(self.index_file) < os.path.getmtime(self.uniprot_file):
+            build_uniprot_index(source=self.uniprot_file, index_file=self.index_file)
+        self._connection = None
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(f"file:{self.index_file}?mode=ro", uri=True,
+                                               check_same_thread=False)
+            self._connection.execute("PRAGMA mmap_size = 4294967296")
+        return self._connection
+
+    def get_mapping(self, ids) -> pd.DataFrame:
+        """
+        Get mapping of given accessions.
+
+        :param ids: Set of protein IDs
+        :return: Dataframe with the columns of the UniProt REST API response for all found IDs
+        """
+        ids = list(set(ids))
+        columns = ", ".join(f'"{x}"' for x in COLUMNS)
+        rows = list()
+        for i in range(0, len(ids), CHUNK_SIZE):
+            ids_chunk = ids[i:i + CHUNK_SIZE]
+            rows += self.connection.execute(f'SELECT {columns} FROM uniprot '
+                                            f'WHERE "Entry" IN ({",".join("?" * len(ids_chunk))})',
+                                            ids_chunk).fetchall()
+        return pd.DataFrame(rows, columns=COLUMNS, dtype=object)
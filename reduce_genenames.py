@@ -2,14 +2,18 @@
 
 import pandas as pd
 import itertools
-from mq_utils.logger import get_reduced_genenames_logging
+from mq_utils.logger import get_reduced_genenames_logging, get_reduced_genenames_overview
+from mq_utils.parallel_utils import map_partitions
 from mq_utils import mapping_handler as mh, runner_utils as ru
+from mq_utils.cell_cache import map_cells
+from mq_utils.table_utils import split_ids, join_ids
 from pathlib import Path
-import csv
 
 
 def reduce_genenames(data: pd.DataFrame, gene_column: str, mode:str, organism: str,
-                     res_column: str = None, keep_empty: bool = True, HGNC_mode: str = "mostfrequent"):
+                     res_column: str = None, keep_empty: bool = True, HGNC_mode: str = "mostfrequent",
+                     mapping_dir: str = None, expiry_days: float = None, hgnc_file: str = None,
+                     handler: mh.MappingHandler = None, n_jobs: int = 1):
     """
     Reduce gene names in data file based on chosen mode.
 
@@ -20,6 +24,12 @@ def reduce_genenames(data: pd.DataFrame, gene_column: str, mode:str, organism: s
     :param keep_empty: Set True if rows with no gene names should be kept
     :param organism: Organism to map to
     :param HGNC_mode: Mode on how to select the gene names in HGNC (mostfrequent, all)
+    :param mapping_dir: Directory to persist fetched mappings in. If None, mappings are not persisted.
+    :param expiry_days: Days after which persisted mappings are fetched again. If None, they never expire.
+    :param hgnc_file: Local HGNC complete set file to use instead of the HGNC API in mode HGNC
+    :param handler: Handler with prefetched mappings to reuse, e.g. across chunks of one table. If None, a new
+                    handler is created from the options above.
+    :param n_jobs: Number of processes to transform the rows in after the mappings were fetched
     :param return_log: Set True if log dataframes should be returned
 
     :return: Reduced data as dataframe
@@ -28,7 +38,8 @@ def reduce_genenames(data: pd.DataFrame, gene_column: str, mode:str, organism: s
     data_copy = data_copy.fillna("")
     data_copy[gene_column] = data_copy[gene_column].astype("string")
 
-    handler = mh.MappingHandler()
+    if handler is None:
+        handler = mh.MappingHandler(mapping_dir=mapping_dir, expiry_days=expiry_days, hgnc_file=hgnc_file)
     # ==== Preload info for all IDs ====
     handler.get_mapping(ids=";".join(data_copy[gene_column]).split(";"),
                         in_type="reduced_genes", organism=organism, reduction_mode=mode)
@@ -41,13 +52,20 @@ def reduce_genenames(data: pd.DataFrame, gene_column: str, mode:str, organism: s
     if (mode == "HGNC") and (organism != "human"):
         raise Exception("HGNC Database only for Human Genes!")
 
-    # ==== Reduce Gene Names ====
-    reduced_gene_names = data_copy[gene_column].apply(
-        lambda row: get_reduced_genenames(ids=row.split(";"), handler=handler,
-                                          reduction_mode=mode, HGNC_mode=HGNC_mode, organism=organism))
+    # ==== Reduce Gene Names, all rows at once or parts of the rows in n_jobs processes ====
+    if n_jobs > 1:
+        parts = map_partitions(reduce_partition, data=data_copy[[gene_column]], n_jobs=n_jobs,
+                               shared={"handler": handler}, gene_column=gene_column, organism=organism,
+                               reduction_mode=mode, HGNC_mode=HGNC_mode)
+        reduced_gene_names = pd.concat([x[0] for x in parts])
+        overview = pd.concat([x[1] for x in parts])
+    else:
+        reduced_gene_names, overview = reduce_partition(data_copy, handler=handler, gene_column=gene_column,
+                                                        organism=organism, reduction_mode=mode, HGNC_mode=HGNC_mode)
 
     # ==== Logging ====
-    log_dict = get_reduced_genenames_logging(data_copy[gene_column], reduced_gene_names, handler, organism, mode)
+    log_dict = get_reduced_genenames_logging(data_copy[gene_column], reduced_gene_names, handler, organism, mode,
+                                             overview=overview)
 
     # ==== If target column depending if res_column is set ====
     column = res_column if res_column is not None else gene_column
@@ -62,6 +80,25 @@ def reduce_genenames(data: pd.DataFrame, gene_column: str, mode:str, organism: s
     return data_copy, log_dict
 
 
+def reduce_partition(data: pd.DataFrame, handler, gene_column: str, organism=None, reduction_mode="ensembl",
+                     HGNC_mode="mostfrequent"):
+    """
+    Reduce gene names and build the overview log of (a part of) the rows.
+
+    :param data: Dataframe containing a column with gene names
+    :param handler: Handler with prefetched mappings
+    :param gene_column: Column name with gene names
+    :param organism: Organism of the gene names
+    :param reduction_mode: Mode on how to reduce gene names
+    :param HGNC_mode: Mode on how to select the gene names in HGNC (mostfrequent, all)
+    :return: Series with reduced gene names and overview log
+    """
+    reduced_gene_names = get_reduced_genenames_bulk(ids=data[gene_column], handler=handler,
+                                                    reduction_mode=reduction_mode, HGNC_mode=HGNC_mode,
+                                                    organism=organism)
+    return reduced_gene_names, get_reduced_genenames_overview(data[gene_column], reduced_gene_names)
+
+
 def get_reduced_genenames(ids, handler, organism=None, reduction_mode="ensembl", HGNC_mode="mostfrequent"):
     mapping = handler.get_mapping(ids=ids, in_type="reduced_genes", organism=organism, reduction_mode=reduction_mode)
     if mapping.empty:
@@ -83,18 +120,77 @@ def get_reduced_genenames(ids, handler, organism=None, reduction_mode="ensembl",
         return ";".join(list(set(reduced_genenames)))
 
 
+def get_reduced_genenames_bulk(ids: pd.Series, handler, organism=None, reduction_mode="ensembl",
+                               HGNC_mode="mostfrequent") -> pd.Series:
+    """
+    Reduce gene names of all rows in one pass. Gives the same result as applying get_reduced_genenames on each row.
+    Each distinct cell is reduced once, cells reduced in earlier calls on the same handler are taken from its cell
+    cache.
+
+    :param ids: Series with semicolon separated gene names per row
+    :param handler: Handler for mappings
+    :param organism: Organism of the gene names
+    :param reduction_mode: Mode on how to reduce gene names
+    :param HGNC_mode: Mode on how to select the gene names in HGNC (mostfrequent, all)
+    :return: Series with reduced gene names per row
+    """
+    return map_cells(ids, transform=lambda cells: get_reduced_genenames_cells(ids=cells, handler=handler,
+                                                                              organism=organism,
+                                                                              reduction_mode=reduction_mode,
+                                                                              HGNC_mode=HGNC_mode),
+                     cache=handler.cell_cache, key=("reduced_genes", "reduce", organism, reduction_mode, HGNC_mode))
+
+
+def get_reduced_genenames_cells(ids: pd.Series, handler, organism=None, reduction_mode="ensembl",
+                                HGNC_mode="mostfrequent") -> pd.Series:
+    """
+    Reduce gene names of the given cells in one vectorized pass.
+
+    :param ids: Series with semicolon separated gene names per cell
+    :param handler: Handler for mappings
+    :param organism: Organism of the gene names
+    :param reduction_mode: Mode on how to reduce gene names
+    :param HGNC_mode: Mode on how to select the gene names in HGNC (mostfrequent, all)
+    :return: Series with reduced gene names per cell
+    """
+    # ==== Join gene names of all rows with the mapping once ====
+    split = split_ids(ids, name="Gene Name").drop_duplicates()
+    mapping, _ = handler.get_preloaded(in_list=split["Gene Name"].cat.categories, in_type="reduced_genes",
+                                       organism=organism, reduction_mode=reduction_mode)
+    # ==== Merge on the integer codes of the split IDs ====
+    mapping = split.merge(mapping.astype({"Gene Name": split["Gene Name"].dtype}), on="Gene Name", how="inner")
+    if reduction_mode == "HGNC":
+        # separate case because we have two modes (mostfrequent and all)
+        mapping = mapping.dropna(subset=["Reduced Gene Name"]).explode("Reduced Gene Name")
+        if HGNC_mode == "mostfrequent":
+            counts = mapping.groupby(["row", "Reduced Gene Name"]).size().reset_index(name="count")
+            mapping = counts[counts["count"] == counts.groupby("row")["count"].transform("max")]
+    else:
+        # remove None
+        mapping = mapping[mapping["Reduced Gene Name"].notna() & (mapping["Reduced Gene Name"] != "None")]
+    return join_ids(mapping, column=ids, name="Reduced Gene Name")
+
+
 if __name__ == "__main__":
     description = "                  Reduce gene names in data file."
     parameters = ru.save_parameters(script_desc=description,
-                                    arguments=('d', 'gc_req', 'rm', 'or_req', 'rc', 'ke', 'hm', 'o'))
-    res, log = reduce_genenames(data=parameters.data, gene_column=parameters.gene_column, mode=parameters.mode,
-                                organism=parameters.organism, res_column = parameters.res_column,
-                                keep_empty=parameters.keep_empty, HGNC_mode= parameters.hgnc_mode)
-    res.to_csv(parameters.out_dir + Path(parameters.file_name).stem + "_reduced.txt", header=True,
-               index=False, quoting=csv.QUOTE_NONNUMERIC, sep=" ")
-
-    log["Overview_Log"].to_csv(parameters.out_dir + Path(parameters.file_name).stem + "_reduced_overview_log.txt",
-                               header = True, index = False, quoting=csv.QUOTE_NONNUMERIC, sep=" ")
-    log["Detailed_Log" ].to_csv(
-        parameters.out_dir + Path( parameters.file_name ).stem + "_reduced_detailed_log.txt",
-        header=True, index=False, quoting=csv.QUOTE_NONNUMERIC, sep=" " )
+                                    arguments=('d', 'gc_req', 'rm', 'or_req', 'rc', 'ke', 'hm', 'md', 'hf', 'cs', 'nj', 'o'))
+    # ==== One handler for all chunks in streaming mode ====
+    handler = mh.MappingHandler(mapping_dir=parameters.mapping_dir, expiry_days=parameters.expiry_days,
+                                hgnc_file=parameters.hgnc_file)
+    out_file = parameters.out_dir + Path(parameters.file_name).stem
+    # ==== Enrichment depends on the whole gene list, so it is run once on the gene column of all chunks ====
+    if parameters.chunk_size is not None and parameters.mode == "enrichment":
+        genes = pd.read_table(parameters.data_file, usecols=[parameters.gene_column])[parameters.gene_column]
+        handler.get_mapping(ids=";".join(genes.fillna("").astype(str)).split(";"), in_type="reduced_genes",
+                            organism=parameters.organism, reduction_mode="enrichment")
+    ru.write_results(data=parameters.data,
+                     process=lambda data: reduce_genenames(data=data, gene_column=parameters.gene_column,
+                                                           mode=parameters.mode, organism=parameters.organism,
+                                                           res_column=parameters.res_column,
+                                                           keep_empty=parameters.keep_empty,
+                                                           HGNC_mode=parameters.hgnc_mode, handler=handler,
+                                                           n_jobs=parameters.n_jobs),
+                     files={"Data": out_file + "_reduced.txt",
+                            "Overview_Log": out_file + "_reduced_overview_log.txt",
+                            "Detailed_Log": out_file + "_reduced_detailed_log.txt"})
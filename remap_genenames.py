@@ -1,9 +1,13 @@
 #!/usr/bin/python3
 
-import csv
+import os
 import pandas as pd
+from functools import lru_cache
 from mq_utils import mapping_handler as mh, runner_utils as ru
-from mq_utils.logger import get_remapped_genenames_logging
+from mq_utils.cell_cache import map_cells
+from mq_utils.logger import get_remapped_genenames_logging, get_remapped_genenames_overview
+from mq_utils.parallel_utils import map_partitions
+from mq_utils.table_utils import split_ids, join_ids
 from fasta_grepper import grep_header_info
 from pathlib import Path
 import warnings
@@ -13,7 +17,9 @@ warnings.filterwarnings('ignore')
 
 def remap_genenames(data: pd.DataFrame, mode: str, protein_column: str, gene_column: str = None,
                     skip_filled: bool = False, organism: str = None, fasta: str = None, keep_empty: bool = True,
-                    res_column: str = None):
+                    res_column: str = None,
+                    mapping_dir: str = None, expiry_days: float = None,
+                    uniprot_file: str = None, handler: mh.MappingHandler = None, n_jobs: int = 1):
     """
     Remap gene names in data file based on chosen mode.
 
@@ -26,13 +32,21 @@ def remap_genenames(data: pd.DataFrame, mode: str, protein_column: str, gene_col
     :param fasta: Fasta file
     :param keep_empty: Set True if empty rows should be kept
     :param res_column: Set column name for remap genenames results. If None, the gene_column will be overridden.
+    :param mapping_dir: Directory to persist fetched mappings in. If None, mappings are not persisted.
+    :param expiry_days: Days after which persisted mappings are fetched again. If None, they never expire.
+    :param uniprot_file: Local UniProt FASTA or TSV export to use instead of the UniProt API
+    :param handler: Handler with prefetched mappings to reuse, e.g. across chunks of one table. If None, a new
+                    handler is created from the options above.
+    :param n_jobs: Number of processes to parse the fasta file and to transform the rows in after the mappings were
+                   fetched
     :return: Remapped data as dataframe
     """
     data_copy = data.copy(deep=True)
     data_copy = data_copy.fillna("")
     data_copy[protein_column] = data_copy[protein_column].astype("string")
 
-    handler = mh.MappingHandler()
+    if handler is None:
+        handler = mh.MappingHandler(mapping_dir=mapping_dir, expiry_days=expiry_days, uniprot_file=uniprot_file)
     # ==== Preload info for all IDs ====
     handler.get_mapping(ids=";".join(data_copy[protein_column]).split(";"),
                         in_type="protein", organism=organism)
@@ -42,28 +56,29 @@ def remap_genenames(data: pd.DataFrame, mode: str, protein_column: str, gene_col
     data_copy[temp_gene_column] = "" if temp_gene_column not in data_copy.columns else data_copy[temp_gene_column].fillna("")
 
     # ==== Get fasta mapping ====
+    fasta_index = None
     if fasta is not None and mode in ['all', 'fasta']:
-        fasta_mapping = grep_header_info(fasta=parameters.mapping_file)
-        remapped_gene_names = data_copy.apply(
-            lambda row: get_fasta_mapping(ids=row[protein_column].split(";"), genename=row[temp_gene_column],
-                                          mapping=fasta_mapping, skip_filled=skip_filled), axis=1)
-        skip_filled = True
+        fasta_index = load_fasta_index(fasta=fasta, cache_dir=mapping_dir, modified=os.path.getmtime(fasta),
+                                       n_jobs=n_jobs)
+
+    # ==== Remap all rows at once, or parts of the rows in n_jobs processes ====
+    if n_jobs > 1:
+        parts = map_partitions(remap_partition, data=data_copy[[protein_column, temp_gene_column]], n_jobs=n_jobs,
+                               shared={"handler": handler, "fasta_index": fasta_index}, mode=mode,
+                               protein_column=protein_column, gene_column=temp_gene_column,
+                               skip_filled=skip_filled, organism=organism)
+        remapped_gene_names = pd.concat([x[0] for x in parts])
+        overview = pd.concat([x[1] for x in parts])
     else:
-        remapped_gene_names = data_copy[temp_gene_column]
-
-    # ==== Get uniprot mappings ====
-    if mode != 'fasta':
-        data_copy["temp"] = remapped_gene_names  # copy into df for apply function
-        remapped_gene_names = data_copy.apply(
-            lambda row: get_uniprot_mapping(ids=row[protein_column].split(";"), genename=row["temp"],
-                                            mode=mode, organism=organism, handler=handler,
-                                            skip_filled=skip_filled), axis=1)
-        del data_copy["temp"]
+        remapped_gene_names, overview = remap_partition(data_copy, handler=handler, fasta_index=fasta_index,
+                                                        mode=mode, protein_column=protein_column,
+                                                        gene_column=temp_gene_column, skip_filled=skip_filled,
+                                                        organism=organism)
 
     # ==== Logging ====
     log_dict = get_remapped_genenames_logging(original=data_copy[temp_gene_column], remapped=remapped_gene_names,
                                               protein_ids=";".join(data_copy[protein_column]).split(";"),
-                                              handler=handler, organism=organism)
+                                              handler=handler, organism=organism, overview=overview)
 
     # ==== If target column depending if res_column is set ====
     column = res_column if res_column is not None else temp_gene_column
@@ -82,6 +97,39 @@ def remap_genenames(data: pd.DataFrame, mode: str, protein_column: str, gene_col
     return data_copy, log_dict
 
 
+def remap_partition(data: pd.DataFrame, handler, fasta_index, mode: str, protein_column: str, gene_column: str,
+                    skip_filled: bool = False, organism: str = None):
+    """
+    Remap gene names and build the overview log of (a part of) the rows.
+
+    :param data: Dataframe containing a column with protein IDs and a column with gene names
+    :param handler: Handler with prefetched mappings
+    :param fasta_index: Accession to gene name index as returned by get_fasta_index. If None, the fasta file is not
+                        used.
+    :param mode: Mode on how to map gene names
+    :param protein_column: Column name with protein IDs
+    :param gene_column: Column name with gene names
+    :param skip_filled: Set True if rows with already filled gene names should be ignored
+    :param organism: Organism to map to
+    :return: Series with remapped gene names and overview log
+    """
+    # ==== Get fasta mapping ====
+    if fasta_index is not None:
+        remapped_gene_names = get_fasta_mapping_bulk(ids=data[protein_column], genenames=data[gene_column],
+                                                     index=fasta_index, skip_filled=skip_filled)
+        skip_filled = True
+    else:
+        remapped_gene_names = data[gene_column]
+
+    # ==== Get uniprot mappings ====
+    if mode != 'fasta':
+        remapped_gene_names = get_uniprot_mapping_bulk(ids=data[protein_column], genenames=remapped_gene_names,
+                                                       mode=mode, organism=organism, handler=handler,
+                                                       skip_filled=skip_filled)
+    return remapped_gene_names, get_remapped_genenames_overview(original=data[gene_column],
+                                                                remapped=remapped_gene_names)
+
+
 def get_fasta_mapping(ids, genename, mapping=None, skip_filled=False):
     """
     Get gene names from fasta file for empty entries or all if skip_filles is set to false.
@@ -99,6 +147,53 @@ def get_fasta_mapping(ids, genename, mapping=None, skip_filled=False):
         return genename
 
 
+@lru_cache(maxsize=1)
+def load_fasta_index(fasta: str, cache_dir: str = None, modified: float = None, n_jobs: int = 1) -> pd.DataFrame:
+    """
+    Grep and index fasta header information once for all calls with the same, unmodified fasta file.
+
+    :param fasta: Fasta file
+    :param cache_dir: Directory to save the grepped information in
+    :param modified: Modification time of the fasta file, to grep it again once it changed
+    :param n_jobs: Number of processes parsing parts of the fasta file in parallel
+    :return: Accession to gene name index as returned by get_fasta_index
+    """
+    return get_fasta_index(mapping=grep_header_info(fasta=fasta, n_jobs=n_jobs, cache_dir=cache_dir))
+
+
+def get_fasta_index(mapping: pd.DataFrame) -> pd.DataFrame:
+    """
+    Build accession to gene name index from fasta header information.
+
+    :param mapping: Mapping from fasta file as returned by grep_header_info
+    :return: Dataframe with unique pairs of 'uniprot' and non-empty 'symbol' indexed by 'uniprot'
+    """
+    index = mapping[["uniprot", "symbol"]].dropna()
+    index = index[index["symbol"] != ""].drop_duplicates()
+    return index.set_index("uniprot")
+
+
+def get_fasta_mapping_bulk(ids: pd.Series, genenames: pd.Series, index: pd.DataFrame,
+                           skip_filled=False) -> pd.Series:
+    """
+    Get gene names from fasta file for all rows in one pass. Gives the same result as applying get_fasta_mapping on
+    each row, except that headers without gene name do not add an empty name.
+
+    :param ids: Series with semicolon separated protein IDs per row
+    :param genenames: Series with mapped gene names per row
+    :param index: Accession to gene name index as returned by get_fasta_index
+    :param skip_filled: Set True if skip mapping when genename is not empty
+    :return: Series with gene names per row
+    """
+    split = split_ids(ids, name="uniprot").drop_duplicates()
+    symbols = split.join(index, on="uniprot", how="inner")
+    remapped = join_ids(symbols, column=ids, name="symbol")
+    # ==== Keep filled gene names if skip_filled ====
+    if skip_filled:
+        remapped = remapped.where(genenames.to_numpy() == "", genenames.to_numpy())
+    return remapped
+
+
 def get_uniprot_mapping(ids, genename, mode, handler, organism=None, skip_filled=False):
     """
     Get gene names from uniprot for empty entries or all if skip_filles is set to false.
@@ -122,6 +217,69 @@ def get_uniprot_mapping(ids, genename, mode, handler, organism=None, skip_filled
         return genename
 
 
+def get_uniprot_mapping_bulk(ids: pd.Series, genenames: pd.Series, mode, handler, organism=None,
+                             skip_filled=False) -> pd.Series:
+    """
+    Get gene names from uniprot for all rows in one pass. Gives the same result as applying get_uniprot_mapping
+    on each row, except that ties in mode uniprot_one are resolved by first occurrence. Each distinct protein ID cell
+    is mapped once, cells mapped in earlier calls on the same handler are taken from its cell cache.
+
+    :param ids: Series with semicolon separated protein IDs per row
+    :param genenames: Series with mapped gene names per row
+    :param mode: Mode on how to map gene names
+    :param handler: Handler for uniprot mappings
+    :param organism: Organism to map to
+    :param skip_filled: Set True if skip mapping when genename is not empty
+    :return: Series with gene names per row
+    """
+    remapped = map_cells(ids, transform=lambda cells: get_uniprot_mapping_cells(ids=cells, mode=mode, handler=handler,
+                                                                                organism=organism),
+                         cache=handler.cell_cache, key=("protein", "remap", mode, organism))
+    # ==== Keep filled gene names if skip_filled ====
+    if skip_filled:
+        remapped = remapped.where(genenames.to_numpy() == "", genenames.to_numpy())
+    return remapped
+
+
+def get_uniprot_mapping_cells(ids: pd.Series, mode, handler, organism=None) -> pd.Series:
+    """
+    Get gene names from uniprot for the given protein ID cells in one vectorized pass.
+
+    :param ids: Series with semicolon separated protein IDs per cell
+    :param mode: Mode on how to map gene names
+    :param handler: Handler for uniprot mappings
+    :param organism: Organism to map to
+    :return: Series with gene names per cell
+    """
+    # ==== Join protein IDs of all rows with the mapping once ====
+    split = split_ids(ids, name="Protein ID").drop_duplicates()
+    mapping, _ = handler.get_preloaded(in_list=split["Protein ID"].cat.categories, in_type="protein",
+                                       organism=organism)
+    # ==== Merge on the integer codes of the split IDs ====
+    mapping = mapping.drop_duplicates().astype({"Protein ID": split["Protein ID"].dtype})
+    mapping = split.merge(mapping, on="Protein ID", how="inner")
+    # ==== One row per mapped gene name ====
+    names = mapping[["row", "Protein ID"]].assign(
+        name=mapping['Gene Names'].fillna("").str.split(";")).explode("name").drop_duplicates()
+    names = names[names["name"] != ""]
+    if mode == "uniprot_one":
+        # ==== Get primary gene name first if only one for all ====
+        primary = mapping['Gene Names (primary)'].fillna("").groupby(mapping["row"])
+        single = primary.first()[primary.nunique() == 1]
+        # ==== Most frequent out of all ====
+        counts = names.groupby(["row", "name"], sort=False).size().reset_index(name="count")
+        counts = counts.sort_values(["row", "count"], ascending=[True, False], kind="stable")
+        frequent = counts.drop_duplicates("row").set_index("row")["name"]
+        frequent = frequent[~frequent.index.isin(single.index)]
+        remapped = join_ids(pd.concat([single, frequent]).rename("name").reset_index(), column=ids, name="name")
+    elif mode == "uniprot_primary":
+        primary = mapping[["row"]].assign(name=mapping['Gene Names (primary)'].str.split(";")).explode("name")
+        remapped = join_ids(primary.dropna(), column=ids, name="name")
+    else:
+        remapped = join_ids(names, column=ids, name="name")
+    return remapped
+
+
 def get_single_genename(ids, handler: mh.MappingHandler, organism=None):
     """
     Get most frequent gene name from uniprot.
@@ -183,18 +341,22 @@ def get_all_genenames(ids, handler: mh.MappingHandler, organism=None):
 if __name__ == "__main__":
     description = "                  Re-mapp gene names in data file."
     parameters = ru.save_parameters(script_desc=description,
-                                    arguments=('d', 'm', 'pc_req', 'gc', 'l', 'or', 'f', 'ke', 'rc', 'o'))
-    res, log = remap_genenames(data=parameters.data, mode=parameters.mode, protein_column=parameters.protein_column,
-                               gene_column=parameters.gene_column, skip_filled=parameters.fill,
-                               organism=parameters.organism, fasta=parameters.fasta_file,
-                               keep_empty=parameters.keep_empty,
-                               res_column=parameters.res_column)
-
-    res.to_csv(parameters.out_dir + Path(parameters.file_name).stem + "_remapped.txt", header=True,
-               index=False, quoting=csv.QUOTE_NONNUMERIC, sep=" ")
-
-    log["Overview_Log"].to_csv(parameters.out_dir + Path(parameters.file_name).stem + "_remapped_overview_log.txt",
-                               header=True, index=False, quoting=csv.QUOTE_NONNUMERIC, sep=" ")
-    log["Detailed_Log"].to_csv(
-        parameters.out_dir + Path(parameters.file_name).stem + "_remapped_detailed_log.txt",
-        header=True, index=False, quoting=csv.QUOTE_NONNUMERIC, sep=" ")
+                                    arguments=('d', 'm', 'pc_req', 'gc', 'l', 'or', 'f', 'ke', 'rc', 'md', 'uf', 'cs',
+                                               'nj', 'o'))
+    # ==== One handler for all chunks in streaming mode ====
+    handler = mh.MappingHandler(mapping_dir=parameters.mapping_dir, expiry_days=parameters.expiry_days,
+                                uniprot_file=parameters.uniprot_file)
+    out_file = parameters.out_dir + Path(parameters.file_name).stem
+    ru.write_results(data=parameters.data,
+                     process=lambda data: remap_genenames(data=data, mode=parameters.mode,
+                                                          protein_column=parameters.protein_column,
+                                                          gene_column=parameters.gene_column,
+                                                          skip_filled=parameters.fill, organism=parameters.organism,
+                                                          fasta=parameters.fasta_file,
+                                                          keep_empty=parameters.keep_empty,
+                                                          res_column=parameters.res_column,
+                                                          mapping_dir=parameters.mapping_dir, handler=handler,
+                                                          n_jobs=parameters.n_jobs),
+                     files={"Data": out_file + "_remapped.txt",
+                            "Overview_Log": out_file + "_remapped_overview_log.txt",
+                            "Detailed_Log": out_file + "_remapped_detailed_log.txt"})
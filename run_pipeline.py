@@ -0,0 +1,123 @@
+#!/usr/bin/python3
+
+import json
+import pandas as pd
+from pathlib import Path
+from mq_utils import mapping_handler as mh, runner_utils as ru
+from filter_ids import filter_protein_ids
+from remap_genenames import remap_genenames
+from reduce_genenames import reduce_genenames
+from map_orthologs import map_orthologs
+
+STAGES = {"filter": filter_protein_ids, "remap": remap_genenames, "reduce": reduce_genenames,
+          "orthologs": map_orthologs}
+
+
+def run_pipeline(data: pd.DataFrame, stages: list, mapping_dir: str = None, expiry_days: float = None,
+                 uniprot_file: str = None, hgnc_file: str = None, ortholog_file: str = None,
+                 ortholog_fallback: bool = False, n_jobs: int = 1, handler: mh.MappingHandler = None):
+    """
+    Run several harmonization stages one after another on the same data, sharing one handler for all mappings.
+
+    :param data: Dataframe the first stage is applied to
+    :param stages: List of stages, each a dictionary with the stage name under "stage" (filter, remap, reduce,
+                   orthologs) and the arguments of the stage function, e.g.
+                   {"stage": "filter", "protein_column": "Protein IDs", "organism": "human"}
+    :param mapping_dir: Directory to persist fetched mappings in. If None, mappings are not persisted.
+    :param expiry_days: Days after which persisted mappings are fetched again. If None, they never expire.
+    :param uniprot_file: Local UniProt FASTA or TSV export to use instead of the UniProt API
+    :param hgnc_file: Local HGNC complete set file to use instead of the HGNC API
+    :param ortholog_file: Local ortholog table (TSV) to use instead of gProfiler
+    :param ortholog_fallback: Set True to request gene names missing in the local ortholog table from gProfiler
+    :param n_jobs: Number of processes to transform the rows in, unless set for a stage
+    :param handler: Handler with prefetched mappings to reuse, e.g. across chunks of one table. If None, a new
+                    handler is created from the options above.
+    :return: Data after the last stage and dictionary with the logging dictionary of each stage. Logs of stages
+             used more than once are named <stage>_<position>.
+    """
+    if handler is None:
+        handler = mh.MappingHandler(mapping_dir=mapping_dir, expiry_days=expiry_days, uniprot_file=uniprot_file,
+                                    hgnc_file=hgnc_file, ortholog_file=ortholog_file,
+                                    ortholog_fallback=ortholog_fallback)
+    logs = dict()
+    for name, stage in zip(get_stage_names(stages), stages):
+        arguments = {x: y for x, y in stage.items() if x != "stage"}
+        arguments.setdefault("n_jobs", n_jobs)
+        # ==== Fasta headers are cached in the mapping directory ====
+        if stage["stage"] == "remap":
+            arguments.setdefault("mapping_dir", mapping_dir)
+        data, log = STAGES[stage["stage"]](data=data, handler=handler, **arguments)
+        logs[name] = log
+    return data, logs
+
+
+def get_stage_names(stages: list) -> list:
+    """
+    Get the names the logs of the stages are saved under.
+
+    :param stages: List of stages as passed to run_pipeline
+    :return: List with the stage name, or <stage>_<position> for stages used more than once
+    """
+    names = [stage["stage"] for stage in stages]
+    return [x if names.count(x) == 1 else f"{x}_{position}" for position, x in enumerate(names, start=1)]
+
+
+def get_log_names(stages: list) -> list:
+    """
+    Get the names of all logs of the stages, as returned by flatten_logs.
+
+    :param stages: List of stages as passed to run_pipeline
+    :return: List of log names
+    """
+    log_names = list()
+    for name, stage in zip(get_stage_names(stages), stages):
+        # ==== Orthologs of several target organisms have one set of logs per target ====
+        tar_organism = stage.get("tar_organism")
+        targets = [f"{name}_{x}" for x in dict.fromkeys(tar_organism)] \
+            if stage["stage"] == "orthologs" and not isinstance(tar_organism, str) else [name]
+        log_names += [f"{x}_{log_type}" for x in targets for log_type in ["Overview_Log", "Detailed_Log"]]
+    return log_names
+
+
+def flatten_logs(logs: dict) -> dict:
+    """
+    Flatten the logs of run_pipeline to one dataframe per stage, log type and target organism.
+
+    :param logs: Dictionary with the logging dictionary of each stage
+    :return: Dictionary with names like <stage>_Overview_Log or <stage>_<tar_organism>_Overview_Log
+    """
+    flat = dict()
+    for stage, log in logs.items():
+        # ==== Orthologs of several target organisms have one logging dictionary per target ====
+        stage_logs = {stage: log} if "Overview_Log" in log else {f"{stage}_{tar}": x for tar, x in log.items()}
+        for name, stage_log in stage_logs.items():
+            for log_type, frame in stage_log.items():
+                flat[f"{name}_{log_type}"] = frame
+    return flat
+
+
+if __name__ == "__main__":
+    description = "          Run filter, remap, reduce and ortholog stages on data file."
+    parameters = ru.save_parameters(script_desc=description,
+                                    arguments=('d', 'st_req', 'md', 'uf', 'hf', 'of', 'cs', 'nj', 'o'))
+    with open(parameters.stages) as f:
+        pipeline_stages = json.load(f)
+    # ==== Enrichment depends on the whole gene list, which earlier stages may still change per chunk ====
+    if parameters.chunk_size is not None and any(x["stage"] == "reduce" and x.get("mode") == "enrichment"
+                                                 for x in pipeline_stages):
+        raise ValueError("Reduce stages with mode enrichment can not be run in chunks, run them without -cs")
+    # ==== One handler for all stages and chunks ====
+    pipeline_handler = mh.MappingHandler(mapping_dir=parameters.mapping_dir, expiry_days=parameters.expiry_days,
+                                         uniprot_file=parameters.uniprot_file, hgnc_file=parameters.hgnc_file,
+                                         ortholog_file=parameters.ortholog_file,
+                                         ortholog_fallback=parameters.ortholog_fallback)
+    out_file = parameters.out_dir + Path(parameters.file_name).stem
+    files = {"Data": out_file + "_pipeline.txt"}
+    files.update({x: out_file + "_" + x.lower() + ".txt" for x in get_log_names(pipeline_stages)})
+
+    def process(data):
+        data, logs = run_pipeline(data=data, stages=pipeline_stages, mapping_dir=parameters.mapping_dir,
+                                  n_jobs=parameters.n_jobs, handler=pipeline_handler)
+        return data, flatten_logs(logs)
+
+    ru.write_results(data=parameters.data, process=process, files=files)
@@ -0,0 +1,45 @@
+import pytest
+import requests
+from mq_utils import HGNC_mapping
+
+
+class Response:
+    def __init__(self, status_code, docs=()):
+        self.status_code = status_code
+        self.docs = list(docs)
+
+    def json(self):
+        return {"response": {"docs": self.docs}}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(str(self.status_code))
+
+
+@pytest.fixture
+def responses(monkeypatch):
+    responses = list()
+    monkeypatch.setattr(HGNC_mapping, "_fetch_HGNC", lambda id, request: responses.pop(0))
+    monkeypatch.setattr(HGNC_mapping.time, "sleep", lambda seconds: None)
+    return responses
+
+
+def test_transient_errors_are_retried(responses):
+    responses += [Response(503), Response(429), Response(200, [{"hgnc_id": "HGNC:5", "symbol": "A1BG"}])]
+    records = HGNC_mapping.get_HGNC_records("A1BG")
+    assert [x["Symbol"] for x in records] == ["A1BG"]
+
+
+def test_failed_requests_are_not_taken_for_missing_entries(responses):
+    responses += [Response(500)] * (HGNC_mapping.MAX_RETRIES + 1)
+    with pytest.raises(requests.HTTPError):
+        HGNC_mapping.get_HGNC_records("A1BG")
+    responses += [Response(500)] * (HGNC_mapping.MAX_RETRIES + 1)
+    with pytest.raises(requests.HTTPError):
+        HGNC_mapping.get_HGNC_mappings(["A1BG"], request_types=("symbol",), n_workers=1)
+
+
+@pytest.mark.parametrize("response", [Response(404), Response(200)])
+def test_genes_without_entry_are_missing(responses, response):
+    responses.append(response)
+    assert HGNC_mapping.get_HGNC_records("NOTAGENE") == []
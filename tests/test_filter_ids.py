@@ -0,0 +1,34 @@
+import pandas as pd
+import pytest
+from mq_utils import mapping_handler as mh
+import filter_ids as fi
+
+
+@pytest.fixture
+def handler():
+    handler = mh.MappingHandler()
+    handler.protein_table.append(pd.DataFrame({
+        "Gene Names": ["G1", "G2", "G3", "G4"],
+        "Gene Names (primary)": ["G1", "G2", "G3", "G4"],
+        "Reviewed": ["reviewed", "reviewed", "unreviewed", "reviewed"],
+        "Organism": ["Homo sapiens (Human)", "Homo sapiens (Human)", "Homo sapiens (Human)",
+                     "Mus musculus (Mouse)"],
+        "Protein ID": ["P1", "P2", "P3", "P4"]}))
+    # ==== IDs without mapping are known misses, so nothing is requested from UniProt ====
+    handler.add_known_missing(ids=["", "X", "Y", "CON__P9", "REV__P8"], in_type="protein")
+    return handler
+
+
+@pytest.mark.parametrize("rows", [["P2", "X"], ["X", "Y"], ["P1;P2", "P3", "", "P4;X"],
+                                  ["P1;CON__P9", "REV__P8;P3", "CON__P9"]])
+@pytest.mark.parametrize("organism", [None, "human"])
+@pytest.mark.parametrize("rev_con", [False, True])
+@pytest.mark.parametrize("reviewed", [False, True])
+def test_filter_protein_ids_matches_per_row(handler, rows, organism, rev_con, reviewed):
+    data = pd.DataFrame({"Protein IDs": rows})
+    result, _ = fi.filter_protein_ids(data=data, protein_column="Protein IDs", organism=organism, rev_con=rev_con,
+                                      reviewed=reviewed, handler=handler)
+    expected = [fi.get_filtered_ids(ids=x.split(";"), handler=handler, organism=organism, rev_con=rev_con,
+                                    reviewed=reviewed) for x in rows]
+    # ==== Per-row results are joined from sets, so the order of the IDs is not fixed ====
+    assert [set(x.split(";")) for x in result["Protein IDs"]] == [set(x.split(";")) for x in expected]
@@ -0,0 +1,29 @@
+import pandas as pd
+import pytest
+from mq_utils import mapping_handler as mh
+import map_orthologs as mo
+
+
+@pytest.fixture
+def handler():
+    handler = mh.MappingHandler()
+    handler.ortholog_table.append(pd.DataFrame({
+        "source_symbol": ["G1", "G2", "G2", "G3", "G4", "G5", "G1"],
+        "source_organism": "human",
+        "ensg": None, "ortholog_ensg": None,
+        "target_symbol": ["M1", "M2A", "M2B", "N/A", "None", None, "R1"],
+        "target_organism": ["mouse", "mouse", "mouse", "mouse", "mouse", "mouse", "rat"],
+        "description": None}))
+    return handler
+
+
+# ==== G6 and X have no ortholog rows, G3-G5 only rows without a target symbol ====
+@pytest.mark.parametrize("rows", [["G1", "G2", "G1;G2", "G3", "G4", "G5", "G3;G4;G5", "G1;G5;X", "G6", "X", ""],
+                                  ["G2;G6", "G2;G6", "G6;G2"]])
+@pytest.mark.parametrize("tar_organism", ["mouse", "rat"])
+def test_orthologs_bulk_matches_per_row(handler, rows, tar_organism):
+    result = mo.get_orthologs_bulk(pd.Series(rows), handler=handler, organism="human", tar_organism=tar_organism)
+    expected = [mo.get_orthologs(ids=x.split(";"), handler=handler, organism="human", tar_organism=tar_organism)
+                for x in rows]
+    # ==== Per-row results are joined from sets, so the order of the names is not fixed ====
+    assert [set(x.split(";")) for x in result] == [set(x.split(";")) for x in expected]
@@ -0,0 +1,121 @@
+import pandas as pd
+from mq_utils import mapping_handler as mh
+
+
+def get_protein_mapping(ids):
+    return pd.DataFrame({"Gene Names": [f"G{x}" for x in ids], "Gene Names (primary)": [f"G{x}" for x in ids],
+                         "Reviewed": "reviewed", "Organism": "Homo sapiens (Human)", "Protein ID": ids})
+
+
+def test_export_store_reuses_unchanged_tables():
+    handler = mh.MappingHandler()
+    handler.protein_table.append(get_protein_mapping(["P1", "P2"]))
+    first = handler.export_store()
+    # ==== Appending known rows does not change the table ====
+    handler.protein_table.append(get_protein_mapping(["P1"]))
+    second = handler.export_store()
+    assert second.protein_table is first.protein_table
+    assert second.ortholog_table is first.ortholog_table
+    handler.protein_table.append(get_protein_mapping(["P3"]))
+    third = handler.export_store()
+    assert third.protein_table is not first.protein_table
+    assert third.ortholog_table is first.ortholog_table
+    assert third.protein_table.missing(["P1", "P3", "P4"]) == ["P4"]
+
+
+class LocalUniProtIndex:
+    def __init__(self, mapping: pd.DataFrame):
+        self.mapping = mapping
+
+    def get_mapping(self, ids):
+        mapping = self.mapping[self.mapping["Protein ID"].isin(ids)]
+        return mapping.rename(columns={"Protein ID": "Entry"})
+
+
+def test_local_uniprot_file_does_not_share_persistent_cache(tmp_path):
+    online = mh.MappingHandler(mapping_dir=str(tmp_path))
+    online.get_uniprot_chunk = lambda ids_chunk: get_protein_mapping(["P1"]).assign(**{"Gene Names": "REST1 REST2"})
+    online.get_mapping(ids=["P1", "P2"], in_type="protein")
+    assert online.get_known_missing(ids=["P2"], in_type="protein") == {"P2"}
+
+    # ==== Local run neither reads the REST results and misses nor writes its own ====
+    local = mh.MappingHandler(mapping_dir=str(tmp_path))
+    local.uniprot_index = LocalUniProtIndex(get_protein_mapping(["P1", "P2"]))
+    mapping = local.get_mapping(ids=["P1", "P2"], in_type="protein")
+    assert sorted(mapping["Gene Names"]) == ["GP1", "GP2"]
+
+    later = mh.MappingHandler(mapping_dir=str(tmp_path))
+    assert later.get_unresolved(ids=["P1", "P2"], in_type="protein") == []
+    assert later.get_preloaded(in_list=["P1"], in_type="protein")[0]["Gene Names"].tolist() == ["REST1;REST2"]
+
+
+class LocalOrthologIndex:
+    def __init__(self, mapping: pd.DataFrame):
+        self.mapping = mapping
+
+    def get_mapping(self, ids, organism, tar_organism):
+        return self.mapping[self.mapping["source_symbol"].isin(ids)]
+
+
+def get_ortholog_mapping(ids, targets):
+    return pd.DataFrame({"source_symbol": ids, "source_organism": "human", "ensg": "", "ortholog_ensg": "",
+                         "target_symbol": targets, "target_organism": "mouse", "description": ""})
+
+
+def test_local_ortholog_table_does_not_share_persistent_cache(tmp_path):
+    online = mh.MappingHandler(mapping_dir=str(tmp_path))
+    online.request_ortholog_mapping = lambda ids, organism, tar_organism: get_ortholog_mapping(["A"], ["gp_a"])
+    online.get_ortholog_mappings(ids=["A", "B"], organism="human", tar_organisms=["mouse"])
+    assert online.get_known_missing(ids=["B"], in_type="orthologs", organism="human", tar_organism="mouse") == {"B"}
+
+    # ==== Local run neither reads the gProfiler orthologs and misses nor writes its own ====
+    local = mh.MappingHandler(mapping_dir=str(tmp_path))
+    local.ortholog_index = LocalOrthologIndex(get_ortholog_mapping(["A", "B"], ["a", "b"]))
+    local.get_ortholog_mappings(ids=["A", "B"], organism="human", tar_organisms=["mouse"])
+    mapping, missing = local.get_preloaded(in_list=["A", "B"], in_type="orthologs", organism="human",
+                                           tar_organism="mouse")
+    assert sorted(mapping["target_symbol"]) == ["a", "b"] and missing == []
+
+    later = mh.MappingHandler(mapping_dir=str(tmp_path))
+    assert later.get_unresolved(ids=["A", "B"], in_type="orthologs", organism="human", tar_organism="mouse") == []
+    assert later.get_preloaded(in_list=["A"], in_type="orthologs", organism="human",
+                               tar_organism="mouse")[0]["target_symbol"].tolist() == ["gp_a"]
+
+
+def test_enrichment_reductions_are_not_persisted(tmp_path):
+    def get_reduction(ids, organism):
+        return pd.DataFrame({"Gene Name": ids, "Reduced Gene Name": [ids[0]] + [None] * (len(ids) - 1),
+                             "Organism": organism})
+
+    handler = mh.MappingHandler(mapping_dir=str(tmp_path))
+    handler.get_enrichment_reduction = get_reduction
+    handler.get_ensembl_reduction = get_reduction
+    for mode in ["enrichment", "ensembl"]:
+        handler.get_mapping(ids=["A", "B"], in_type="reduced_genes", organism="human", reduction_mode=mode)
+
+    later = mh.MappingHandler(mapping_dir=str(tmp_path))
+    assert later.get_unresolved(ids=["A", "B"], in_type="reduced_genes", organism="human",
+                                reduction_mode="enrichment") == ["A", "B"]
+    assert later.get_unresolved(ids=["A", "B"], in_type="reduced_genes", organism="human",
+                                reduction_mode="ensembl") == []
+
+
+def test_local_file_indexes_are_built_in_mapping_dir(tmp_path):
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    (source_dir / "uniprot.tsv").write_text("Entry\tGene Names\tGene Names (primary)\tReviewed\tOrganism\n"
+                                            "P1\tG1 G1B\tG1\treviewed\tHomo sapiens (Human)\n")
+    (source_dir / "orthologs.tsv").write_text("source_symbol\tsource_organism\ttarget_symbol\ttarget_organism\n"
+                                              "G1\thsapiens\tg1\tmmusculus\n")
+    (source_dir / "hgnc_complete_set.txt").write_text("symbol\talias_symbol\tprev_symbol\tstatus\n"
+                                                      "G1\tG1B\t\tApproved\n")
+    handler = mh.MappingHandler(mapping_dir=str(tmp_path / "mappings"),
+                                uniprot_file=str(source_dir / "uniprot.tsv"),
+                                ortholog_file=str(source_dir / "orthologs.tsv"),
+                                hgnc_file=str(source_dir / "hgnc_complete_set.txt"))
+    # ==== The directory of the local files is left untouched ====
+    assert sorted(x.name for x in source_dir.iterdir()) == ["hgnc_complete_set.txt", "orthologs.tsv", "uniprot.tsv"]
+    assert len(list((tmp_path / "mappings").glob("*.index.*"))) == 3
+    assert handler.uniprot_index.get_mapping(["P1"])["Gene Names (primary)"].tolist() == ["G1"]
+    assert handler.ortholog_index.get_mapping(["G1"], "human", "mouse")["target_symbol"].tolist() == ["g1"]
+    assert handler.hgnc_index["alias_symbol"] == {"G1B": ["G1"]}
@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+from mq_utils.mapping_table import MappingTable
+
+
+def test_lookup_returns_values_as_appended():
+    table = MappingTable(columns=["Gene Name", "Reduced Gene Name", "Organism", "Mode"],
+                         keys=["Gene Name", "Organism", "Mode"], categories=["Organism", "Mode"])
+    mapping = pd.DataFrame({"Gene Name": ["A", "A", "B", "C"],
+                            "Reduced Gene Name": [["A1", "A2"], "A", None, "None"],
+                            "Organism": ["human", "human", "mouse", np.nan],
+                            "Mode": ["HGNC", "HGNC", "ensembl", "ensembl"]})
+    table.append(mapping)
+    # ==== Rows already in the table are skipped ====
+    table.append(mapping.iloc[[1]])
+    assert len(table) == 4
+    rows = table.lookup([("A", "human", "HGNC"), ("B", "mouse", "ensembl"), ("B", "human", "ensembl")])
+    assert rows.values.tolist() == [["A", ["A1", "A2"], "human", "HGNC"], ["A", "A", "human", "HGNC"],
+                                    ["B", None, "mouse", "ensembl"]]
+    assert table.missing([("B", "mouse", "ensembl"), ("B", "human", "ensembl")]) == [("B", "human", "ensembl")]
+    assert table.frame["Organism"].dtype == "category"
+    assert table.frame["Organism"].isna().tolist() == [False, False, False, True]
+
+
+def test_missing_values_are_deduplicated():
+    table = MappingTable(columns=["Gene Names", "Organism", "Protein ID"], keys=["Protein ID"],
+                         categories=["Organism"])
+    # ==== An all empty column is read as float NaN ====
+    table.append(pd.DataFrame({"Gene Names": [np.nan], "Organism": [np.nan], "Protein ID": ["P1"]}))
+    table.append(pd.DataFrame({"Gene Names": [float("nan")], "Organism": [float("nan")], "Protein ID": ["P1"]}))
+    table.append(pd.DataFrame({"Gene Names": [None], "Organism": [None], "Protein ID": ["P1"]}))
+    assert len(table) == 1
+    assert table.lookup(["P1"]).values.tolist() == [[None, None, "P1"]]
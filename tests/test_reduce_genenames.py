@@ -0,0 +1,35 @@
+import pandas as pd
+import pytest
+from mq_utils import mapping_handler as mh
+import reduce_genenames as rg
+
+
+@pytest.fixture
+def handler():
+    handler = mh.MappingHandler()
+    handler.reduced_gene_table.append(pd.DataFrame({
+        "Gene Name": ["G1", "G2", "G3", "G4", "G4"],
+        "Reduced Gene Name": ["R1", "None", None, "R4A", "R4B"],
+        "Organism": "human", "Mode": "ensembl"}))
+    handler.reduced_gene_table.append(pd.DataFrame({
+        "Gene Name": ["H1", "H2", "H3", "H4"],
+        "Reduced Gene Name": [["A", "B"], ["A"], None, ["C"]],
+        "Organism": "human", "Mode": "HGNC"}))
+    # ==== Gene names without reduction are known misses, so nothing is requested ====
+    for reduction_mode in ["ensembl", "HGNC"]:
+        handler.add_known_missing(ids=["", "X"], in_type="reduced_genes", organism="human",
+                                  reduction_mode=reduction_mode)
+    return handler
+
+
+@pytest.mark.parametrize("reduction_mode, HGNC_mode, rows", [
+    ("ensembl", "mostfrequent", ["G1", "G2", "G3", "G1;G2;G3", "G4", "G1;G4;X", "X", ""]),
+    ("HGNC", "mostfrequent", ["H1", "H1;H2", "H1;H4", "H3", "H2;H3;X", "X", ""]),
+    ("HGNC", "all", ["H1", "H1;H2", "H1;H4", "H3", "H2;H3;X", "X", ""])])
+def test_reduce_genenames_matches_per_row(handler, reduction_mode, HGNC_mode, rows):
+    result = rg.get_reduced_genenames_bulk(pd.Series(rows), handler=handler, organism="human",
+                                           reduction_mode=reduction_mode, HGNC_mode=HGNC_mode)
+    expected = [rg.get_reduced_genenames(ids=x.split(";"), handler=handler, organism="human",
+                                         reduction_mode=reduction_mode, HGNC_mode=HGNC_mode) for x in rows]
+    # ==== Per-row results are joined from sets, so the order of the names is not fixed ====
+    assert [set(x.split(";")) for x in result] == [set(x.split(";")) for x in expected]
@@ -0,0 +1,66 @@
+import pandas as pd
+import pytest
+from mq_utils import mapping_handler as mh
+import remap_genenames as rg
+
+
+@pytest.fixture
+def handler():
+    handler = mh.MappingHandler()
+    handler.protein_table.append(pd.DataFrame({
+        "Gene Names": ["G1;G1B", "G2", "G1;G3", "G4", None],
+        "Gene Names (primary)": ["G1", "G2", "G1", "G4", None],
+        "Reviewed": ["reviewed", "reviewed", "reviewed", "reviewed", "reviewed"],
+        "Organism": ["Homo sapiens (Human)", "Homo sapiens (Human)", "Homo sapiens (Human)",
+                     "Mus musculus (Mouse)", "Homo sapiens (Human)"],
+        "Protein ID": ["P1", "P2", "P3", "P4", "P5"]}))
+    # ==== IDs without mapping are known misses, so nothing is requested from UniProt ====
+    handler.add_known_missing(ids=["", "X", "P6", "P7"], in_type="protein")
+    return handler
+
+
+@pytest.fixture
+def fasta_index():
+    return rg.get_fasta_index(pd.DataFrame({"uniprot": ["P1", "P2", "P2", "P6", "P7"],
+                                            "symbol": ["F1", "F2", "F2B", "F6", None]}))
+
+
+def get_expected(rows, genenames, mode, handler, organism, skip_filled, fasta_index):
+    """
+    Remap each row with the per-row functions, in the order of remap_partition.
+    """
+    expected = list()
+    for ids, genename in zip(rows, genenames):
+        ids = ids.split(";")
+        row_skip_filled = skip_filled
+        if mode in ["fasta", "all"]:
+            genename = rg.get_fasta_mapping(ids=ids, genename=genename, mapping=fasta_index.reset_index(),
+                                            skip_filled=skip_filled)
+            row_skip_filled = True
+        if mode != "fasta":
+            genename = rg.get_uniprot_mapping(ids=ids, genename=genename, mode=mode, handler=handler,
+                                              organism=organism, skip_filled=row_skip_filled)
+        expected.append(genename)
+    return expected
+
+
+# ==== uniprot_one fails per row for IDs without mapping and resolves ties differently, so its rows avoid both ====
+@pytest.mark.parametrize("mode, rows", [
+    ("uniprot", ["P1", "P1;P3", "P2;X", "X", "", "P4;P5", "P5"]),
+    ("uniprot_primary", ["P1", "P1;P3", "P2;X", "X", "", "P4;P5", "P5"]),
+    ("uniprot_one", ["P1", "P1;P3", "P1;P2;P3", "P2;X", "P5", "P1;P2;P3;P5"]),
+    ("fasta", ["P1", "P2;P6", "P7", "X", "", "P1;P3"]),
+    ("all", ["P1", "P2;P6", "P7", "P3;X", "X", "", "P4;P5"])])
+@pytest.mark.parametrize("organism", [None, "human"])
+@pytest.mark.parametrize("skip_filled", [False, True])
+def test_remap_partition_matches_per_row(handler, fasta_index, mode, rows, organism, skip_filled):
+    genenames = ["OLD" if i % 2 == 0 else "" for i in range(len(rows))]
+    data = pd.DataFrame({"Protein IDs": rows, "Gene Names": genenames})
+    result, _ = rg.remap_partition(data, handler=handler,
+                                   fasta_index=fasta_index if mode in ["fasta", "all"] else None, mode=mode,
+                                   protein_column="Protein IDs", gene_column="Gene Names", skip_filled=skip_filled,
+                                   organism=organism)
+    expected = get_expected(rows, genenames, mode=mode, handler=handler, organism=organism,
+                            skip_filled=skip_filled, fasta_index=fasta_index)
+    # ==== Per-row results are joined from sets, so the order of the names is not fixed ====
+    assert [set(x.split(";")) for x in result] == [set(x.split(";")) for x in expected]